@@ -1,43 +1,154 @@
 """API para gestión de incidencias."""
-import requests
-from typing import Dict, Any, Optional, List
+import re
+from typing import Dict, Any, Optional, List, Iterator, AsyncIterator
 from datetime import datetime, timedelta
-from config import MOCK_GESTOR_URL
+from api.http_client import request, async_request
+from config import MOCK_GESTOR_URL, GESTOR_PAGE_SIZE
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 BASE_URL = MOCK_GESTOR_URL
 
+def _iter_pages(path: str, endpoint: str, params: Dict[str, Any], page_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over a paginated gestor listing (cursor in the X-Next-Cursor header).
+    Each page is parsed incrementally from the response stream when ijson is available, and the
+    next page is only requested once the caller has consumed the current one.
+    """
+    cursor = None
+    while True:
+        page_params = {**params, "limit": page_size}
+        if cursor:
+            page_params["cursor"] = cursor
+        
+        response = request("GET", f"{BASE_URL}{path}", endpoint, params=page_params, stream=True)
+        try:
+            if ijson is not None:
+                response.raw.decode_content = True
+                page = list(ijson.items(response.raw, "item", use_float=True))
+            else:
+                page = response.json()
+            cursor = response.headers.get("X-Next-Cursor")
+        finally:
+            response.close()
+        
+        yield from page
+        if not cursor or not page:
+            return
+
+async def _aiter_pages(path: str, endpoint: str, params: Dict[str, Any], page_size: int) -> AsyncIterator[Dict[str, Any]]:
+    """Async version of _iter_pages: same cursor protocol, one page in memory at a time."""
+    cursor = None
+    while True:
+        page_params = {**params, "limit": page_size}
+        if cursor:
+            page_params["cursor"] = cursor
+        
+        response = await async_request("GET", f"{BASE_URL}{path}", endpoint, params=page_params)
+        page = response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        
+        for item in page:
+            yield item
+        if not cursor or not page:
+            return
+
+def iter_incidencias(buzon: str = "GR_SAL_COMP_AUTORIZACIONES", page_size: int = GESTOR_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """Iterate over open incidents page by page. If buzon is provided, the API filters by that mailbox."""
+    params = {"buzon": buzon} if buzon else {}
+    for incidencia in _iter_pages("/api/incidencias", "gestor.get_incidencias", params, page_size):
+        # Filter by buzon too, in case the API ignores it
+        if not buzon or incidencia.get("buzon") == buzon:
+            yield incidencia
+
 def get_incidencias(buzon: str = "GR_SAL_COMP_AUTORIZACIONES") -> List[Dict[str, Any]]:
     """Get open incidents. If buzon is provided, filter by that mailbox."""
+    return list(iter_incidencias(buzon))
+
+async def aiter_incidencias(buzon: str = "GR_SAL_COMP_AUTORIZACIONES",
+                            page_size: int = GESTOR_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """Async version of iter_incidencias."""
+    params = {"buzon": buzon} if buzon else {}
+    async for incidencia in _aiter_pages("/api/incidencias", "gestor.get_incidencias", params, page_size):
+        if not buzon or incidencia.get("buzon") == buzon:
+            yield incidencia
+
+async def get_incidencias_async(buzon: str = "GR_SAL_COMP_AUTORIZACIONES") -> List[Dict[str, Any]]:
+    """Async version of get_incidencias."""
+    return [incidencia async for incidencia in aiter_incidencias(buzon)]
+
+def parse_fecha_gestor(fecha: str) -> Optional[datetime]:
+    """Parse a gestor date such as "01/11/2024 14:30:00 CEST" (timezone suffix ignored)."""
+    match = re.match(r"^(\d{2}/\d{2}/\d{4})[ ,]+(\d{1,2}:\d{2}:\d{2})", fecha or "")
+    if not match:
+        return None
+    return datetime.strptime(f"{match.group(1)} {match.group(2)}", "%d/%m/%Y %H:%M:%S")
+
+def get_fecha_cierre(incidencia: Dict[str, Any]) -> Optional[datetime]:
+    """Closing date of an incident: last history entry, or opening date if there is no history."""
+    historial = incidencia.get("historial") or []
+    return parse_fecha_gestor(historial[-1]["Fecha"] if historial else incidencia.get("apertura"))
+
+def _filter_incidencias_cerradas(incidencias_cerradas: List[Dict[str, Any]], buzon: str,
+                                 desde: Optional[datetime]) -> List[Dict[str, Any]]:
+    """Filter closed incidents by buzon and by closing date (in case the API ignores `since`)."""
+    if buzon:
+        incidencias_cerradas = [inc for inc in incidencias_cerradas if inc["buzon"] == buzon]
+    
+    if desde:
+        incidencias_cerradas = [
+            inc for inc in incidencias_cerradas
+            if (get_fecha_cierre(inc) or datetime.min) >= desde
+        ]
+    
+    return incidencias_cerradas
+
+def iter_incidencias_cerradas(buzon: str = "GR_SAL_COMP_AUTORIZACIONES", desde: Optional[datetime] = None,
+                              page_size: int = GESTOR_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over closed incidents page by page, filtered by buzon and closing date on the API side.
+    If `desde` is provided, only incidents closed at or after that date are returned.
+    """
     params = {}
     if buzon:
         params["buzon"] = buzon
+    if desde:
+        params["since"] = desde.isoformat(timespec="seconds")
     
-    response = requests.get(f"{BASE_URL}/api/incidencias", params=params)
-    response.raise_for_status()
-    return response.json()
+    for incidencia in _iter_pages("/api/incidencias/cerradas", "gestor.get_incidencias_cerradas", params, page_size):
+        yield from _filter_incidencias_cerradas([incidencia], buzon, desde)
 
-def get_incidencias_cerradas(buzon: str = "GR_SAL_COMP_AUTORIZACIONES", meses: int = 2) -> List[Dict[str, Any]]:
-    """Get closed incidents. For mock, returns all closed incidents regardless of date."""
-    response = requests.get(f"{BASE_URL}/api/incidencias/cerradas")
-    response.raise_for_status()
-    incidencias_cerradas = response.json()
-    
-    # Filter by buzon if provided
+def get_incidencias_cerradas(buzon: str = "GR_SAL_COMP_AUTORIZACIONES", meses: int = 2,
+                             desde: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Get closed incidents. For mock, returns all closed incidents regardless of `meses`.
+    If `desde` is provided, only incidents closed at or after that date are returned.
+    """
+    return list(iter_incidencias_cerradas(buzon, desde))
+
+async def aiter_incidencias_cerradas(buzon: str = "GR_SAL_COMP_AUTORIZACIONES", desde: Optional[datetime] = None,
+                                     page_size: int = GESTOR_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """Async version of iter_incidencias_cerradas."""
+    params = {}
     if buzon:
-        incidencias_cerradas = [inc for inc in incidencias_cerradas if inc["buzon"] == buzon]
+        params["buzon"] = buzon
+    if desde:
+        params["since"] = desde.isoformat(timespec="seconds")
     
-    # For mock environment, return all incidents (no date filtering)
-    return incidencias_cerradas
+    async for incidencia in _aiter_pages("/api/incidencias/cerradas", "gestor.get_incidencias_cerradas", params, page_size):
+        for filtrada in _filter_incidencias_cerradas([incidencia], buzon, desde):
+            yield filtrada
 
-def patch_incidencia(
-    cod_incidencia: str,
-    action: str,
-    buzon_destino: str = None,
-    notas_resolucion: str = None,
-    detalle: str = None,
-    **kwargs
-) -> Dict[str, Any]:
-    """Update an incident with a specific action."""
+async def get_incidencias_cerradas_async(buzon: str = "GR_SAL_COMP_AUTORIZACIONES", meses: int = 2,
+                                         desde: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Async version of get_incidencias_cerradas."""
+    return [incidencia async for incidencia in aiter_incidencias_cerradas(buzon, desde)]
+
+def _patch_data(action: str, buzon_destino: str, notas_resolucion: str, detalle: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the PATCH body accepting both snake_case and camelCase parameters."""
     # Flexible parameter handling
     buzon_destino = buzon_destino or kwargs.get('buzonDestino', None)
     notas_resolucion = notas_resolucion or kwargs.get('notasResolucion', None)
@@ -52,12 +163,61 @@ def patch_incidencia(
     if detalle:
         data["detalle"] = detalle
     
+    return data
+
+def patch_incidencia(
+    cod_incidencia: str,
+    action: str,
+    buzon_destino: str = None,
+    notas_resolucion: str = None,
+    detalle: str = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """Update an incident with a specific action."""
+    data = _patch_data(action, buzon_destino, notas_resolucion, detalle, kwargs)
+    
     print(f"Sending request to {BASE_URL}/api/incidencias/{cod_incidencia}")
     print(f"With data: {data}")
     
-    response = requests.patch(
+    # Not idempotent: each PATCH adds a history entry, so it is only retried if the connection failed
+    response = request(
+        "PATCH",
         f"{BASE_URL}/api/incidencias/{cod_incidencia}",
+        "gestor.patch_incidencia",
         json=data
     )
-    response.raise_for_status()
-    return response.json() 
\ No newline at end of file
+    return response.json()
+
+def patch_incidencias_bulk(operaciones: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Apply several incident actions in one request. Each operation carries an `idOperacion`
+    the API uses to skip operations it already applied, so the call is safe to retry.
+    Returns one result per operation: {"idOperacion", "codIncidencia", "ok", "error"?}.
+    """
+    response = request(
+        "POST",
+        f"{BASE_URL}/api/incidencias/bulk",
+        "gestor.patch_incidencias_bulk",
+        idempotent=True,
+        json={"operaciones": operaciones}
+    )
+    return response.json()["resultados"]
+
+async def patch_incidencia_async(
+    cod_incidencia: str,
+    action: str,
+    buzon_destino: str = None,
+    notas_resolucion: str = None,
+    detalle: str = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """Async version of patch_incidencia."""
+    data = _patch_data(action, buzon_destino, notas_resolucion, detalle, kwargs)
+    
+    response = await async_request(
+        "PATCH",
+        f"{BASE_URL}/api/incidencias/{cod_incidencia}",
+        "gestor.patch_incidencia",
+        json=data
+    )
+    return response.json()
@@ -0,0 +1,162 @@
+"""Sesión HTTP compartida (síncrona y asíncrona) para las APIs de gestor y sistema."""
+import asyncio
+import random
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from core.circuit_breaker import get_breaker
+from core.metrics import system_metrics
+from observabilidad.logger import main_logger
+from config import (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_MAXSIZE, HTTP_MAX_RETRIES,
+                    HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX)
+
+# Métodos que se pueden repetir sin efectos secundarios
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Respuestas transitorias que merecen reintento
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+# Cliente asíncrono y bucle de eventos al que pertenece
+_async_client = None
+_async_client_loop = None
+
+
+def get_session() -> requests.Session:
+    """Sesión compartida con pool de conexiones (se crea en el primer uso)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_MAXSIZE, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def backoff_delay(attempt: int) -> float:
+    """Espera exponencial con jitter completo para el intento indicado (0 = primer reintento)."""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def request(method: str, url: str, endpoint: str, idempotent: bool = None, **kwargs) -> requests.Response:
+    """
+    Llamada HTTP con timeouts, reintentos y métricas de latencia por endpoint.
+
+    Las llamadas idempotentes (por método o marcadas con idempotent=True) se reintentan ante
+    errores de conexión, timeouts y respuestas 429/502/503/504. Las no idempotentes solo se
+    reintentan si la conexión no llegó a establecerse, porque entonces la petición no se envió.
+    Cada intento pasa por el circuit breaker de la dependencia (prefijo del endpoint): con el
+    circuito abierto se lanza CircuitOpenError sin llamar.
+    """
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+
+    breaker = get_breaker(endpoint.split(".")[0])
+    attempt = 0
+    while True:
+        breaker.before_call()
+        start = time.perf_counter()
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except requests.exceptions.ConnectTimeout as e:
+            error, response, retryable = e, None, True
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error, response, retryable = e, None, idempotent
+        else:
+            error, retryable = None, idempotent and response.status_code in RETRY_STATUS_CODES
+
+        elapsed = time.perf_counter() - start
+        ok = error is None and response.status_code < 400
+        system_metrics.record_api_call(endpoint, elapsed, ok, retry=attempt > 0)
+        # Los 4xx (salvo 429) son errores de la petición, no de la dependencia
+        breaker.record(elapsed, error is not None or response.status_code >= 500 or response.status_code == 429)
+
+        if not retryable or attempt >= HTTP_MAX_RETRIES:
+            if error is not None:
+                raise error
+            response.raise_for_status()
+            return response
+
+        delay = backoff_delay(attempt)
+        main_logger.warning(f"Reintentando {endpoint} en {delay:.2f}s", extra_data={
+            "action": "http_retry",
+            "endpoint": endpoint,
+            "attempt": attempt + 1,
+            "status_code": response.status_code if response is not None else None,
+            "error": str(error) if error is not None else None
+        })
+        time.sleep(delay)
+        attempt += 1
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Cliente asíncrono compartido con pool de conexiones (uno por bucle de eventos)."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_POOL_MAXSIZE, max_keepalive_connections=HTTP_POOL_MAXSIZE)
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client():
+    """Cierra el cliente asíncrono y sus conexiones."""
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client, _async_client_loop = None, None
+
+
+async def async_request(method: str, url: str, endpoint: str, idempotent: bool = None, **kwargs) -> httpx.Response:
+    """Versión asíncrona de request: mismos timeouts, reintentos y métricas."""
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+
+    breaker = get_breaker(endpoint.split(".")[0])
+    attempt = 0
+    while True:
+        breaker.before_call()
+        start = time.perf_counter()
+        try:
+            response = await get_async_client().request(method, url, **kwargs)
+        except (httpx.ConnectTimeout, httpx.ConnectError) as e:
+            error, response, retryable = e, None, True
+        except httpx.TransportError as e:
+            error, response, retryable = e, None, idempotent
+        else:
+            error, retryable = None, idempotent and response.status_code in RETRY_STATUS_CODES
+
+        elapsed = time.perf_counter() - start
+        ok = error is None and response.status_code < 400
+        system_metrics.record_api_call(endpoint, elapsed, ok, retry=attempt > 0)
+        # Los 4xx (salvo 429) son errores de la petición, no de la dependencia
+        breaker.record(elapsed, error is not None or response.status_code >= 500 or response.status_code == 429)
+
+        if not retryable or attempt >= HTTP_MAX_RETRIES:
+            if error is not None:
+                raise error
+            response.raise_for_status()
+            return response
+
+        delay = backoff_delay(attempt)
+        main_logger.warning(f"Reintentando {endpoint} en {delay:.2f}s", extra_data={
+            "action": "http_retry",
+            "endpoint": endpoint,
+            "attempt": attempt + 1,
+            "status_code": response.status_code if response is not None else None,
+            "error": str(error) if error is not None else None
+        })
+        await asyncio.sleep(delay)
+        attempt += 1
@@ -1,36 +1,65 @@
 """API para sistema de gestión."""
-import requests
 from typing import Dict, Any
+from api.http_client import request, async_request
 from config import MOCK_SISTEMA_URL
 
 BASE_URL = MOCK_SISTEMA_URL
 
 def get_poliza(numero_poliza: str) -> Dict[str, Any]:
     """Get policy information."""
-    response = requests.get(f"{BASE_URL}/api/poliza/{numero_poliza}")
-    response.raise_for_status()
+    response = request("GET", f"{BASE_URL}/api/poliza/{numero_poliza}", "sistema.get_poliza")
     return response.json()
 
-def comprobacion_poliza(
-    poliza: str,
-    cod_solucion: str = None,
-    str_json: str = None,
-    **kwargs
-) -> Dict[str, Any]:
-    """Check policy status and get resolution."""
+async def get_poliza_async(numero_poliza: str) -> Dict[str, Any]:
+    """Async version of get_poliza."""
+    response = await async_request("GET", f"{BASE_URL}/api/poliza/{numero_poliza}", "sistema.get_poliza")
+    return response.json()
+
+def _comprobacion_data(poliza: str, cod_solucion: str, str_json: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the policy check body accepting both snake_case and camelCase parameters."""
     # Flexible parameter handling
     cod_solucion = cod_solucion or kwargs.get('codSolucion', '')
     str_json = str_json or kwargs.get('strJson', '')
     
-    data = {
+    return {
         "poliza": poliza,
         "codSolucion": cod_solucion,
         "strJson": str_json
     }
+
+def comprobacion_poliza(
+    poliza: str,
+    cod_solucion: str = None,
+    str_json: str = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """Check policy status and get resolution."""
+    data = _comprobacion_data(poliza, cod_solucion, str_json, kwargs)
+    
+    # Read-only check: safe to retry even though it is a POST
+    response = request(
+        "POST",
+        f"{BASE_URL}/api/comprobacionPoliza",
+        "sistema.comprobacion_poliza",
+        idempotent=True,
+        json=data
+    )
+    return response.json()
+
+async def comprobacion_poliza_async(
+    poliza: str,
+    cod_solucion: str = None,
+    str_json: str = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """Async version of comprobacion_poliza."""
+    data = _comprobacion_data(poliza, cod_solucion, str_json, kwargs)
     
-    response = requests.post(
+    response = await async_request(
+        "POST",
         f"{BASE_URL}/api/comprobacionPoliza",
+        "sistema.comprobacion_poliza",
+        idempotent=True,
         json=data
     )
-    response.raise_for_status()
-    return response.json() 
\ No newline at end of file
+    return response.json()
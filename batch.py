@@ -1,128 +1,563 @@
 """Batch para subir incidencias a la base de datos vectorial."""
+import argparse
+import hashlib
 import json
 import os
+import re
 import pandas as pd
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from observabilidad.logger import batch_logger
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from llm.LLMGenerator import generate_summary
-from llm.LLMEmbedding import get_embedding
-from config import VECTOR_DB_URL, ENTORNO
+from llm.LLMEmbedding import get_embeddings
+from core.collection_version import bump_collection_version, get_collection_version
+from core.lexical import document_text, document_sparse_vector
+from config import (VECTOR_DB_URL, ENTORNO, LEXICAL_VECTOR_NAME, VECTOR_QUANTIZATION, QUANTIZATION_ALWAYS_RAM,
+                    BATCH_SUMMARY_WORKERS, BATCH_EMBEDDING_BATCH_SIZE, BATCH_UPSERT_CHUNK_SIZE,
+                    COLLECTION_ALIAS, BLUE_GREEN_KEEP_COLLECTIONS, COLLECTION_HISTORY_FILE, BATCH_CHECKPOINT_FILE,
+                    BATCH_CSV_CHUNK_SIZE)
+
+# Namespace de los ids de punto deterministas (uuid5 del hash de contenido de cada fila)
+POINT_ID_NAMESPACE = uuid.UUID("8f6d3c2e-4b1a-5e7f-9a0b-1c2d3e4f5a6b")
+
+def get_quantization_config(mode: str = VECTOR_QUANTIZATION):
+    """Configuración de cuantización de Qdrant para el modo indicado (none, scalar, binary)."""
+    if mode == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=QUANTIZATION_ALWAYS_RAM
+            )
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=QUANTIZATION_ALWAYS_RAM)
+        )
+    return None
+
+def create_collection(client, collection_name: str, vector_size: int, quantization: str = VECTOR_QUANTIZATION):
+    """Crea la colección con vectores densos, vectores dispersos léxicos y cuantización opcional."""
+    quantization_config = get_quantization_config(quantization)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(
+            size=vector_size,  # Dynamic size based on environment
+            distance=models.Distance.COSINE,
+            # Con cuantización los vectores originales quedan en disco para el rescoring
+            on_disk=quantization_config is not None
+        ),
+        # Índice léxico BM25: Qdrant aplica el IDF sobre los pesos de documento
+        sparse_vectors_config={
+            LEXICAL_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)
+        },
+        quantization_config=quantization_config
+    )
+
+def get_vector_size():
+    """Tamaño de vector según el entorno."""
+    return 384 if ENTORNO == "DESA" else 1536
+
+def get_alias_target(client):
+    """Colección a la que apunta actualmente el alias (None si no existe)."""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == COLLECTION_ALIAS:
+            return alias.collection_name
+    return None
+
+def get_versioned_collections(client):
+    """Colecciones versionadas del catálogo, de la más antigua a la más reciente."""
+    pattern = re.compile(rf"^{COLLECTION_ALIAS}_\d{{8}}_\d{{6}}$")
+    return sorted(c.name for c in client.get_collections().collections if pattern.match(c.name))
 
 def init_vector_db():
+    """Crea una nueva colección versionada vacía; el alias se cambia al terminar la carga."""
     # Initialize Qdrant client
     client = QdrantClient(url=VECTOR_DB_URL)
     
-    # Delete existing collections
-    batch_logger.info("Limpiando colecciones existentes", extra_data={
-        "action": "delete_collection",
-        "collection_name": "incidencias"
+    collection_name = f"{COLLECTION_ALIAS}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    # Create new collection
+    batch_logger.info("Creando nueva colección", extra_data={
+        "action": "create_collection",
+        "collection_name": collection_name,
+        "alias": COLLECTION_ALIAS,
+        "quantization": VECTOR_QUANTIZATION
     })
-    try:
-        client.delete_collection("incidencias")
-    except Exception as e:
-        batch_logger.error(f"Error deleting collection", extra_data={
-            "action": "delete_collection",
-            "collection_name": "incidencias",
-            "error": str(e)
-        })
-        pass
+    create_collection(client, collection_name, get_vector_size())
+    batch_logger.info("Colección creada exitosamente")
     
-    # Set vector size based on environment
-    vector_size = 384 if ENTORNO == "DESA" else 1536
+    return client, collection_name
+
+def switch_alias(client, collection_name):
+    """Apunta el alias a la colección indicada en una única operación atómica."""
+    previous = get_alias_target(client)
+    operations = []
+    if previous:
+        operations.append(models.DeleteAliasOperation(
+            delete_alias=models.DeleteAlias(alias_name=COLLECTION_ALIAS)
+        ))
+    elif COLLECTION_ALIAS in [c.name for c in client.get_collections().collections]:
+        # Migración: la colección antigua sin versionar ocupa el nombre del alias
+        batch_logger.warning("Eliminando colección sin versionar para crear el alias", extra_data={
+            "action": "delete_legacy_collection",
+            "collection_name": COLLECTION_ALIAS
+        })
+        client.delete_collection(COLLECTION_ALIAS)
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=COLLECTION_ALIAS)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
     
-    # Create new collection
-    batch_logger.info("Creando nueva colección")
-    client.create_collection(
-        collection_name="incidencias",
-        vectors_config=models.VectorParams(
-            size=vector_size,  # Dynamic size based on environment
-            distance=models.Distance.COSINE
+    batch_logger.info(f"Alias {COLLECTION_ALIAS} -> {collection_name}", extra_data={
+        "action": "switch_alias",
+        "alias": COLLECTION_ALIAS,
+        "collection_name": collection_name,
+        "previous_collection": previous
+    })
+    return previous
+
+def load_collection_history():
+    """Colecciones publicadas tras el alias, de la más antigua a la activa ([] si no hay registro)."""
+    try:
+        with open(COLLECTION_HISTORY_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def save_collection_history(history):
+    """Guarda el registro de colecciones publicadas de forma atómica."""
+    os.makedirs(os.path.dirname(COLLECTION_HISTORY_FILE) or ".", exist_ok=True)
+    tmp_path = f"{COLLECTION_HISTORY_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, COLLECTION_HISTORY_FILE)
+
+def publish_collection(client, collection_name):
+    """Apunta el alias a la colección y la registra como publicada (solo estas son destino de rollback)."""
+    previous = switch_alias(client, collection_name)
+    history = load_collection_history()
+    if not history and previous:
+        # Registro inexistente (cargas anteriores): la colección que servía el alias estaba publicada
+        history = [previous]
+    history = [name for name in history if name != collection_name] + [collection_name]
+    save_collection_history(history)
+    return previous
+
+def cleanup_old_collections(client, keep=BLUE_GREEN_KEEP_COLLECTIONS):
+    """
+    Elimina las colecciones publicadas antiguas conservando las `keep` últimas publicadas y la activa,
+    y las colecciones versionadas posteriores a la más antigua del registro que no llegaron a
+    publicarse o se retiraron con un rollback (salvo la de una carga pendiente de --resume).
+    Las anteriores al registro (cargas previas a él) no se tocan.
+    """
+    current = get_alias_target(client)
+    history = load_collection_history()
+    if not history:
+        return []
+    kept = history[-keep:] if keep > 0 else []
+    obsolete = [name for name in history if name not in kept and name != current]
+
+    checkpoint = load_checkpoint()
+    in_progress = checkpoint.get("coleccion") if checkpoint else None
+    existing = get_versioned_collections(client)
+    unpublished = [
+        name for name in existing
+        if name > history[0] and name not in history and name not in (current, in_progress)
+    ]
+    history = [name for name in history if name not in obsolete]
+
+    for name in obsolete + unpublished:
+        if name in existing:
+            batch_logger.info(f"Eliminando colección antigua {name}", extra_data={
+                "action": "delete_collection",
+                "collection_name": name,
+                "published": name in obsolete
+            })
+            client.delete_collection(name)
+    save_collection_history(history)
+    return obsolete + unpublished
+
+def rollback_alias(client):
+    """Vuelve a apuntar el alias a la colección publicada anterior a la activa."""
+    current = get_alias_target(client)
+    history = load_collection_history()
+    existing = {c.name for c in client.get_collections().collections}
+    earlier = history[:history.index(current)] if current in history else []
+    previous = next((name for name in reversed(earlier) if name in existing), None)
+    if previous is None:
+        raise RuntimeError(f"No hay colección publicada anterior a {current} para hacer rollback")
+    switch_alias(client, previous)
+    # La colección retirada deja de estar publicada: no vuelve a ser destino de rollback
+    save_collection_history(history[:history.index(previous) + 1])
+    return previous
+
+def clean_metadata(metadata):
+    """Sustituye los NaN de pandas por None para que el contenido sea serializable y estable."""
+    return {k: (None if isinstance(v, float) and v != v else v) for k, v in metadata.items()}
+
+def row_content_hash(metadata) -> str:
+    """Hash del contenido de una fila del catálogo."""
+    content = json.dumps(clean_metadata(metadata), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def point_id_from_hash(content_hash: str) -> str:
+    """Id de punto determinista derivado del contenido de la fila."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, content_hash))
+
+def open_vector_db():
+    """Abre la colección activa del alias (creándola si no existe) sin borrar su contenido."""
+    client = QdrantClient(url=VECTOR_DB_URL)
+    collection_name = get_alias_target(client)
+    if collection_name is None and COLLECTION_ALIAS in [c.name for c in client.get_collections().collections]:
+        # Colección sin versionar de cargas anteriores a los alias
+        collection_name = COLLECTION_ALIAS
+    if collection_name is None:
+        batch_logger.info("La colección no existe, se crea vacía")
+        client, collection_name = init_vector_db()
+        publish_collection(client, collection_name)
+    return client, collection_name
+
+def has_lexical_vectors(client, collection_name):
+    """Indica si la colección tiene configurados los vectores dispersos léxicos."""
+    sparse_vectors = client.get_collection(collection_name).config.params.sparse_vectors or {}
+    return LEXICAL_VECTOR_NAME in sparse_vectors
+
+def get_indexed_points(client, collection_name):
+    """
+    Devuelve los puntos indexados agrupados por fichero de origen: {source_file: {content_hash: id}}.
+    Los puntos sin hash (cargas anteriores a la indexación incremental) quedan bajo la clave None.
+    """
+    indexed = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=256,
+            offset=offset,
+            with_payload=["content_hash", "source_file"],
+            with_vectors=False
         )
-    )
-    batch_logger.info("Colección creada exitosamente")
+        for point in points:
+            payload = point.payload or {}
+            content_hash = payload.get("content_hash")
+            source_file = payload.get("source_file") if content_hash else None
+            indexed.setdefault(source_file, {})[content_hash or str(point.id)] = point.id
+        if offset is None:
+            return indexed
+
+def delete_points(client, collection_name, point_ids):
+    """Elimina puntos de la colección."""
+    if point_ids:
+        client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=list(point_ids))
+        )
+
+def summarize_row(metadata, row_index):
+    """Genera el resumen de una fila con el LLM."""
+    summary = generate_summary(metadata)
+    batch_logger.debug(f"Summary:", extra_data={
+        "action": "generate_summary",
+        "summary": summary,
+        "DESCRIPCION": metadata["DESCRIPCION"],
+        "row_index": row_index,
+        "summary_length": len(summary)
+    })
+    return summary
+
+def embed_summaries(summaries):
+    """Obtiene los embeddings de los resúmenes en lotes de BATCH_EMBEDDING_BATCH_SIZE."""
+    vectors = []
+    for i in range(0, len(summaries), BATCH_EMBEDDING_BATCH_SIZE):
+        vectors.extend(get_embeddings(summaries[i:i + BATCH_EMBEDDING_BATCH_SIZE]))
+    return vectors
+
+def build_point(metadata, content_hash, source_file, summary, vector, lexical=True):
+    """
+    Construye el punto con el embedding del resumen y el vector léxico de la fila
+    (sin vector léxico si la colección no tiene vectores dispersos, p. ej. la colección sin versionar).
+    """
+    if lexical:
+        # Lexical sparse vector over DESCRIPCION, SOLUCIÓN and COMPONENTE
+        lexical_indices, lexical_values = document_sparse_vector(document_text(metadata))
+        vector = {
+            "": vector,
+            LEXICAL_VECTOR_NAME: models.SparseVector(indices=lexical_indices, values=lexical_values)
+        }
     
-    return client
+    return models.PointStruct(
+        id=point_id_from_hash(content_hash),
+        vector=vector,
+        payload={
+            "summary": summary,
+            **metadata,
+            "content_hash": content_hash,
+            "source_file": source_file
+        }
+    )
+
+def load_checkpoint():
+    """Carga el checkpoint de la última ejecución interrumpida (None si no existe)."""
+    try:
+        with open(BATCH_CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_checkpoint(checkpoint):
+    """Guarda el checkpoint de forma atómica."""
+    tmp_path = f"{BATCH_CHECKPOINT_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, BATCH_CHECKPOINT_FILE)
+
+def discard_checkpoint(checkpoint):
+    """
+    Descarta el checkpoint de una carga que no se va a reanudar. Si era una carga completa, su
+    colección no llegó a publicarse y se elimina para que no quede una colección parcial.
+    """
+    collection_name = checkpoint.get("coleccion")
+    if checkpoint.get("modo") == "completo" and collection_name:
+        client = QdrantClient(url=VECTOR_DB_URL)
+        published = set(load_collection_history()) | {get_alias_target(client)}
+        existing = {c.name for c in client.get_collections().collections}
+        if collection_name in existing and collection_name not in published:
+            batch_logger.warning(f"Eliminando colección sin publicar {collection_name}", extra_data={
+                "action": "delete_abandoned_collection",
+                "collection_name": collection_name
+            })
+            client.delete_collection(collection_name)
+    clear_checkpoint()
 
-def process_csv(client, file_path, metadata_columns):
-    # Read CSV file
-    df = pd.read_csv(file_path)
-    total_rows = len(df)
+def clear_checkpoint():
+    """Elimina el checkpoint tras una ejecución completa y consistente."""
+    if os.path.exists(BATCH_CHECKPOINT_FILE):
+        os.remove(BATCH_CHECKPOINT_FILE)
+
+def verify_collection(client, collection_name, expected_hashes):
+    """Comprueba que la colección contiene exactamente las filas de los CSV ({source_file: hashes})."""
+    indexed = get_indexed_points(client, collection_name)
+    files = {}
+    for source_file, hashes in expected_hashes.items():
+        found = set(indexed.pop(source_file, {}))
+        files[source_file] = {
+            "esperados": len(hashes),
+            "faltan": len(hashes - found),
+            "sobran": len(found - hashes)
+        }
+    orphans = sum(len(hashes) for hashes in indexed.values())
+    return {
+        "ficheros": files,
+        "puntos_huerfanos": orphans,
+        "consistente": orphans == 0 and all(f["faltan"] == 0 and f["sobran"] == 0 for f in files.values())
+    }
+
+def iter_pending_chunks(file_path, metadata_columns, indexed_hashes, completed, counters):
+    """
+    Lee el CSV en streaming (bloques de BATCH_CSV_CHUNK_SIZE filas) y devuelve bloques de hasta
+    BATCH_UPSERT_CHUNK_SIZE filas pendientes (hash, metadata). Solo se conservan las columnas de
+    metadata_columns: columnas auxiliares (p. ej. las de revisión del batch de mantenimiento) no
+    llegan al payload ni al hash. Los contadores y el conjunto de hashes del fichero se acumulan
+    en `counters` a medida que se leen las filas.
+    """
+    pending = []
+    # dtype=str: los valores no dependen de la inferencia de tipos de cada bloque y el hash es estable
+    for df_chunk in pd.read_csv(file_path, chunksize=BATCH_CSV_CHUNK_SIZE, dtype=str):
+        for row in df_chunk.to_dict("records"):
+            metadata = clean_metadata({col: value for col, value in row.items() if col in metadata_columns})
+            content_hash = row_content_hash(metadata)
+            counters["total"] += 1
+            
+            # Las filas idénticas comparten id y se indexan una vez
+            if content_hash in counters["hashes"]:
+                counters["sin_cambios"] += 1
+                continue
+            counters["hashes"].add(content_hash)
+            
+            if content_hash in completed:
+                counters["reanudados"] += 1
+            elif content_hash in indexed_hashes:
+                counters["sin_cambios"] += 1
+            else:
+                pending.append((content_hash, metadata))
+                if len(pending) >= BATCH_UPSERT_CHUNK_SIZE:
+                    yield pending
+                    pending = []
+    if pending:
+        yield pending
+
+def process_csv(client, collection_name, file_path, metadata_columns, indexed_hashes=None, checkpoint=None,
+                lexical=True):
+    """
+    Indexa un CSV del catálogo. Con indexed_hashes ({content_hash: id} ya indexados del fichero)
+    solo se procesan las filas nuevas o modificadas y se eliminan las que ya no existen.
+    Las filas ya registradas en el checkpoint se saltan y cada bloque subido se añade a él.
+    Con lexical=False los puntos se suben sin vector léxico.
+
+    El CSV se lee en streaming y las filas se procesan en bloques de BATCH_UPSERT_CHUNK_SIZE: los
+    resúmenes se generan en un pool de BATCH_SUMMARY_WORKERS hilos (el bloque siguiente se adelanta
+    mientras se procesa el actual), los embeddings se piden por lotes y cada bloque se sube con un
+    único upsert. En memoria solo hay dos bloques y los hashes de las filas leídas.
+    """
+    start_time = time.time()
+    source_file = os.path.basename(file_path)
+    indexed_hashes = indexed_hashes or {}
+    completed = set(checkpoint["completados"].get(source_file, [])) if checkpoint else set()
+    counters = {"total": 0, "sin_cambios": 0, "reanudados": 0, "hashes": set()}
     processed = 0
     
-    batch_logger.info(f"Total documents to process {total_rows}", extra_data={
+    batch_logger.info(f"Processing documents from {file_path}", extra_data={
         "action": "start_processing",
         "file_path": file_path,
-        "total_rows": total_rows,
+        "indexed_rows": len(indexed_hashes),
+        "resumed_rows": len(completed),
         "metadata_columns": metadata_columns
     })
     
-    # Process each row
-    for _, row in df.iterrows():
-        # Generate summary using LLM
-        summary = generate_summary(row.to_dict())
-        batch_logger.debug(f"Summary:", extra_data={
-            "action": "generate_summary",
-            "summary": summary,
-            "DESCRIPCION": row["DESCRIPCION"],
-            "row_index": processed,
-            "summary_length": len(summary)
-        })
-        
-        # Get embedding
-        vector = get_embedding(summary)
-        
-        # Prepare metadata
-        metadata = row.to_dict() 
-        batch_logger.debug(f"Metadata:", extra_data={
-            "action": "prepare_metadata",
-            "metadata": metadata,
-            "row_index": processed,
-            "metadata_keys": list(metadata.keys())
-        })
+    with ThreadPoolExecutor(max_workers=BATCH_SUMMARY_WORKERS) as executor:
+        def submit_summaries(chunk, offset):
+            if not chunk:
+                return []
+            return [executor.submit(summarize_row, metadata, offset + i) for i, (_, metadata) in enumerate(chunk)]
         
-        # Add to vector database
-        client.upsert(
-            collection_name="incidencias",
-            points=[
-                models.PointStruct(
-                    id=str(uuid.uuid4()),  # Generate a UUID
-                    vector=vector,
-                    payload={
-                        "summary": summary,
-                        **metadata
-                    }
-                )
+        chunks = iter_pending_chunks(file_path, metadata_columns, indexed_hashes, completed, counters)
+        chunk = next(chunks, None)
+        futures = submit_summaries(chunk, 0)
+        while chunk:
+            # Adelantar los resúmenes del bloque siguiente mientras se procesa este
+            next_chunk = next(chunks, None)
+            next_futures = submit_summaries(next_chunk, processed + len(chunk))
+            
+            summaries = [future.result() for future in futures]
+            vectors = embed_summaries(summaries)
+            points = [
+                build_point(metadata, content_hash, source_file, summary, vector, lexical)
+                for (content_hash, metadata), summary, vector in zip(chunk, summaries, vectors)
             ]
-        )
-        
-        # Update progress
-        processed += 1
-        progress = (processed / total_rows) * 100
-        batch_logger.info(f"Progress: {progress:.1f}% ({processed}/{total_rows})", extra_data={
-            "action": "progress",
-            "progress": progress,
-            "processed": processed,
-            "total": total_rows
-        })
+            
+            # Add to vector database
+            client.upsert(collection_name=collection_name, points=points, wait=True)
+            
+            # Checkpoint de las filas completadas
+            if checkpoint is not None:
+                checkpoint["completados"].setdefault(source_file, []).extend(h for h, _ in chunk)
+                save_checkpoint(checkpoint)
+            
+            # Update progress
+            processed += len(chunk)
+            elapsed = time.time() - start_time
+            batch_logger.info(f"Progress: {processed} processed ({counters['total']} rows read)", extra_data={
+                "action": "progress",
+                "processed": processed,
+                "rows_read": counters["total"],
+                "rows_per_second": round(processed / elapsed, 2) if elapsed > 0 else 0
+            })
+            
+            chunk, futures = next_chunk, next_futures
+    
+    # Remove rows that no longer exist (or changed) in the CSV, once the whole file has been read
+    csv_hashes = counters["hashes"]
+    removed = [point_id for h, point_id in indexed_hashes.items() if h not in csv_hashes]
+    delete_points(client, collection_name, removed)
     
-    batch_logger.info(f"Completed processing {processed} documents from {file_path}")
+    elapsed = time.time() - start_time
+    batch_logger.info(f"Completed processing {processed} documents from {file_path}", extra_data={
+        "action": "complete_processing",
+        "file_path": file_path,
+        "total_rows": counters["total"],
+        "processed": processed,
+        "removed_rows": len(removed)
+    })
+    return {
+        "total": counters["total"],
+        "nuevos": processed,
+        "eliminados": len(removed),
+        "sin_cambios": counters["sin_cambios"],
+        "reanudados": counters["reanudados"],
+        "segundos": round(elapsed, 2),
+        "hashes": csv_hashes
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Carga del catálogo en la base de datos vectorial")
+    parser.add_argument("--delta", action="store_true",
+                        help="Solo indexa filas nuevas o modificadas y elimina las borradas, sin reconstruir la colección")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reanuda la última carga interrumpida a partir del checkpoint")
+    parser.add_argument("--rollback", action="store_true",
+                        help="Vuelve a apuntar el alias a la colección anterior")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
 
     # Start timing
     start_time = time.time()
 
-    # Initialize vector database
-    client = init_vector_db()
+    if args.rollback:
+        client = QdrantClient(url=VECTOR_DB_URL)
+        previous = rollback_alias(client)
+        bump_collection_version()
+        batch_logger.info(f"Rollback completado: {COLLECTION_ALIAS} -> {previous}")
+        return
+
+    mode = "delta" if args.delta else "completo"
+    checkpoint = load_checkpoint()
+    if checkpoint and not args.resume:
+        batch_logger.warning("Existe un checkpoint de una carga interrumpida, se descarta (usar --resume para reanudarla)")
+        discard_checkpoint(checkpoint)
+        checkpoint = None
+    elif args.resume and (checkpoint is None or checkpoint.get("modo") != mode):
+        batch_logger.warning(f"No hay checkpoint en modo {mode} para reanudar, se inicia una carga nueva")
+        if checkpoint:
+            discard_checkpoint(checkpoint)
+        checkpoint = None
+
+    # Initialize vector database (full reloads build a new collection while the alias keeps serving the old one)
+    lexical = True
+    if args.delta:
+        client, collection_name = open_vector_db()
+        indexed = get_indexed_points(client, collection_name)
+        lexical = has_lexical_vectors(client, collection_name)
+        if not lexical:
+            batch_logger.warning(
+                f"La colección {collection_name} no tiene vectores léxicos: la carga delta solo actualiza "
+                "los vectores densos (ejecutar una carga completa para activar la búsqueda híbrida)",
+                extra_data={"action": "delta_without_lexical", "collection_name": collection_name}
+            )
+    elif checkpoint:
+        client = QdrantClient(url=VECTOR_DB_URL)
+        collection_name = checkpoint["coleccion"]
+        indexed = {}
+        batch_logger.info(f"Reanudando carga en {collection_name}", extra_data={
+            "action": "resume_batch",
+            "collection_name": collection_name,
+            "completed_rows": sum(len(hashes) for hashes in checkpoint["completados"].values())
+        })
+    else:
+        client, collection_name = init_vector_db()
+        indexed = {}
+
+    if checkpoint is None:
+        checkpoint = {
+            "modo": mode,
+            "coleccion": collection_name,
+            "inicio": datetime.now().isoformat(),
+            "completados": {}
+        }
+        save_checkpoint(checkpoint)
+    stats = {}
     
     # Process PROBLEMAS_GLOBALES.csv
     batch_logger.info("Processing PROBLEMAS_GLOBALES.csv")
-    process_csv(
+    stats["PROBLEMAS_GLOBALES.csv"] = process_csv(
         client,
+        collection_name,
         "resources/PROBLEMAS_GLOBALES.csv",
         [
             "COMPONENTE",
@@ -132,24 +567,63 @@ def main():
             "FECHA DE RESOLUCIÓN",
             "RESOLUCION AUTOMÁTICA",
             "BUZON REASIGNACION"
-        ]
+        ],
+        indexed.pop("PROBLEMAS_GLOBALES.csv", {}),
+        checkpoint,
+        lexical
     )
     
     # Process CORRECTIVOS_ABIERTOS.csv if it exists
     batch_logger.info("Processing CORRECTIVOS_ABIERTOS.csv")
     correctivos_path = "resources/CORRECTIVOS_ABIERTOS.csv"
     if os.path.exists(correctivos_path):
-        process_csv(
+        stats["CORRECTIVOS_ABIERTOS.csv"] = process_csv(
             client,
+            collection_name,
             correctivos_path,
             [
                 "ID INCIDENCIA",
                 "DESCRIPCION",
                 "FECHA PREVISTA",
                 "RESOLUCION AUTOMÁTICA"
-            ]
+            ],
+            indexed.pop("CORRECTIVOS_ABIERTOS.csv", {}),
+            checkpoint,
+            lexical
         )
 
+    # Puntos de ficheros que ya no existen o de cargas sin hash de contenido
+    orphan_ids = [point_id for hashes in indexed.values() for point_id in hashes.values()]
+    if orphan_ids:
+        batch_logger.info(f"Eliminando {len(orphan_ids)} puntos huérfanos", extra_data={
+            "action": "delete_orphan_points",
+            "orphan_points": len(orphan_ids)
+        })
+        delete_points(client, collection_name, orphan_ids)
+
+    # Comprobación final de consistencia contra los CSV
+    consistency = verify_collection(
+        client, collection_name, {source_file: file_stats.pop("hashes") for source_file, file_stats in stats.items()}
+    )
+    if not consistency["consistente"]:
+        batch_logger.error("La colección no es consistente con los CSV, se conserva el checkpoint", extra_data={
+            "action": "consistency_check_failed",
+            "collection_name": collection_name,
+            **consistency
+        })
+
+    # Publicar la nueva colección y limpiar las antiguas (se conserva la anterior para rollback)
+    previous_collection = None
+    if consistency["consistente"]:
+        if not args.delta:
+            previous_collection = publish_collection(client, collection_name)
+            cleanup_old_collections(client)
+        clear_checkpoint()
+
+    # Marcar la colección como modificada (réplicas locales y cachés se recargan)
+    changes = sum(file_stats["nuevos"] + file_stats["eliminados"] for file_stats in stats.values()) + len(orphan_ids)
+    collection_version = bump_collection_version() if changes or not args.delta else get_collection_version()
+
     total_time = time.time() - start_time
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M")
@@ -159,20 +633,28 @@ def main():
     if os.path.exists(correctivos_path):
         files_processed.append("CORRECTIVOS_ABIERTOS.csv")
     
-    # Contar total de documentos procesados
-    total_docs = 0
-    for file_path in files_processed:
-        if os.path.exists(f"resources/{file_path}"):
-            df_temp = pd.read_csv(f"resources/{file_path}")
-            total_docs += len(df_temp)
+    # Total de documentos leídos durante la carga
+    total_docs = sum(file_stats["total"] for file_stats in stats.values())
     
     reporte = {
         "fecha": datetime.now().isoformat(),
         "tiempo_total_segundos": round(total_time, 2),
         "archivos_procesados": files_processed,
         "total_documentos_cargados": total_docs,
-        "base_datos_vectorial": "inicializada y cargada",
-        "estado": "completado exitosamente"
+        "modo": "delta" if args.delta else "completo",
+        "documentos_nuevos": sum(file_stats["nuevos"] for file_stats in stats.values()),
+        "documentos_eliminados": sum(file_stats["eliminados"] for file_stats in stats.values()) + len(orphan_ids),
+        "documentos_sin_cambios": sum(file_stats["sin_cambios"] for file_stats in stats.values()),
+        "documentos_reanudados": sum(file_stats["reanudados"] for file_stats in stats.values()),
+        "filas_por_segundo": round(
+            sum(file_stats["nuevos"] for file_stats in stats.values()) / total_time, 2
+        ) if total_time > 0 else 0,
+        "base_datos_vectorial": "actualizada incrementalmente" if args.delta else "inicializada y cargada",
+        "coleccion": collection_name,
+        "coleccion_anterior": previous_collection,
+        "version_coleccion": collection_version,
+        "consistencia": consistency,
+        "estado": "completado exitosamente" if consistency["consistente"] else "inconsistente, pendiente de --resume"
     }
     
     with open(report_path, "w", encoding="utf-8") as f:
@@ -0,0 +1,137 @@
+"""Comparativa de recall y latencia entre la colección sin cuantizar y cuantizada."""
+import json
+import random
+import sys
+import time
+from datetime import datetime
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from observabilidad.logger import batch_logger
+from batch import create_collection
+from config import VECTOR_DB_URL, VECTOR_QUANTIZATION, QUANTIZATION_RESCORE, QUANTIZATION_OVERSAMPLING, QUERY_LIMIT_VECTORDB
+
+SOURCE_COLLECTION = "incidencias"
+MAX_QUERIES = 50
+
+def dense_vector(vector):
+    """Vector denso de un punto (los puntos híbridos devuelven un dict de vectores)."""
+    return vector.get("") if isinstance(vector, dict) else vector
+
+def load_points(client):
+    """Descarga todos los puntos (payload y vectores) de la colección origen."""
+    points, offset = [], None
+    while True:
+        page, offset = client.scroll(
+            collection_name=SOURCE_COLLECTION,
+            limit=256,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        points.extend(page)
+        if offset is None:
+            return points
+
+def copy_collection(client, collection_name, points, vector_size, quantization):
+    """Crea una colección temporal con la cuantización indicada y copia los puntos."""
+    client.delete_collection(collection_name)
+    create_collection(client, collection_name, vector_size, quantization)
+    client.upload_points(
+        collection_name=collection_name,
+        points=[models.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points],
+        wait=True
+    )
+
+def measure(client, collection_name, queries, limit, search_params=None):
+    """Ejecuta las consultas y devuelve ids por consulta y latencias en milisegundos."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = client.search(
+            collection_name=collection_name,
+            query_vector=query,
+            limit=limit,
+            search_params=search_params
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([str(hit.id) for hit in hits])
+    return results, latencies
+
+def latency_summary(latencies):
+    """Media y percentil 95 de las latencias."""
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0
+    return {
+        "media_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0,
+        "p95_ms": round(p95, 3)
+    }
+
+def recall(expected, obtained):
+    """Recall medio de los resultados obtenidos frente a los exactos."""
+    values = [len(set(e) & set(o)) / len(e) for e, o in zip(expected, obtained) if e]
+    return round(sum(values) / len(values), 4) if values else 0
+
+def main(quantization=VECTOR_QUANTIZATION, limit=QUERY_LIMIT_VECTORDB):
+    if quantization == "none":
+        quantization = "scalar"
+    start_time = time.time()
+    client = QdrantClient(url=VECTOR_DB_URL)
+
+    points = load_points(client)
+    if not points:
+        batch_logger.warning("La colección está vacía, no hay nada que comparar")
+        return
+
+    vector_size = len(dense_vector(points[0].vector))
+    queries = [dense_vector(p.vector) for p in random.sample(points, min(MAX_QUERIES, len(points)))]
+
+    base_collection = f"{SOURCE_COLLECTION}_cmp_none"
+    quantized_collection = f"{SOURCE_COLLECTION}_cmp_{quantization}"
+
+    batch_logger.info(f"Comparando cuantización {quantization} con {len(points)} puntos y {len(queries)} consultas")
+    try:
+        copy_collection(client, base_collection, points, vector_size, "none")
+        copy_collection(client, quantized_collection, points, vector_size, quantization)
+
+        exact, _ = measure(client, base_collection, queries, limit, models.SearchParams(exact=True))
+        base_results, base_latencies = measure(client, base_collection, queries, limit)
+        quant_results, quant_latencies = measure(
+            client, quantized_collection, queries, limit,
+            models.SearchParams(quantization=models.QuantizationSearchParams(
+                rescore=QUANTIZATION_RESCORE,
+                oversampling=QUANTIZATION_OVERSAMPLING
+            ))
+        )
+        raw_results, raw_latencies = measure(
+            client, quantized_collection, queries, limit,
+            models.SearchParams(quantization=models.QuantizationSearchParams(rescore=False))
+        )
+    finally:
+        client.delete_collection(base_collection)
+        client.delete_collection(quantized_collection)
+
+    reporte = {
+        "fecha": datetime.now().isoformat(),
+        "cuantizacion": quantization,
+        "puntos": len(points),
+        "consultas": len(queries),
+        "limite": limit,
+        "sin_cuantizar": {"recall": recall(exact, base_results), **latency_summary(base_latencies)},
+        "cuantizada_con_rescoring": {"recall": recall(exact, quant_results), **latency_summary(quant_latencies)},
+        "cuantizada_sin_rescoring": {"recall": recall(exact, raw_results), **latency_summary(raw_latencies)},
+        "tiempo_total_segundos": round(time.time() - start_time, 2)
+    }
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
+    report_path = f"resources/reporte_cuantizacion_{timestamp}.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+
+    batch_logger.info("Comparativa de cuantización completada", extra_data={
+        "action": "quantization_comparison_complete",
+        "report_path": report_path,
+        **reporte
+    })
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -1,65 +1,155 @@
 import os
+import argparse
+import numpy as np
 import pandas as pd
 import json
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+from qdrant_client.http import models
 from observabilidad.logger import batch_logger
-from api.gestor_incidencias import get_incidencias_cerradas
-from llm.LLMGenerator import generate_summary
-from llm.LLMQuery import query_vector_db
+from api.gestor_incidencias import get_incidencias_cerradas, get_fecha_cierre
+from batch import (clean_metadata, row_content_hash, open_vector_db, summarize_row, embed_summaries,
+                   build_point, has_lexical_vectors)
+from core.collection_version import bump_collection_version
+from core.circuit_breaker import get_breaker
+from llm.LLMQuery import get_qdrant_client, get_search_params
 from llm.LLMSuggestion import suggest_solution
+from llm.LLMEmbedding import get_embeddings
 from core.utils import simple_json_parse
-from config import CRITIC_APPROVAL_THRESHOLD
+from config import (CRITIC_APPROVAL_THRESHOLD, MAINTENANCE_WORKERS, MAINTENANCE_SEARCH_CONCURRENCY,
+                    MAINTENANCE_LLM_CONCURRENCY, MAINTENANCE_WATERMARK_FILE, MAINTENANCE_CLUSTER_THRESHOLD,
+                    BATCH_EMBEDDING_BATCH_SIZE, BATCH_CSV_CHUNK_SIZE, BATCH_SUMMARY_WORKERS, BATCH_UPSERT_CHUNK_SIZE)
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 
 # Load environment variables
 load_dotenv()
 
-def check_if_incident_exists_in_db(incident_summary: str, similarity_threshold: float = CRITIC_APPROVAL_THRESHOLD) -> bool:
+# Master catalogue the merged entries are appended to
+MASTER_CATALOG_FILE = "resources/PROBLEMAS_GLOBALES.csv"
+
+# Concurrency caps per stage (embedding + vector search, and LLM suggestion)
+search_slots = threading.BoundedSemaphore(MAINTENANCE_SEARCH_CONCURRENCY)
+llm_slots = threading.BoundedSemaphore(MAINTENANCE_LLM_CONCURRENCY)
+
+def embed_descriptions(descriptions: List[str]) -> np.ndarray:
     """
-    Check if similar incident exists in vector database
+    Embed descriptions in batches and return them as a row-normalized matrix
     """
-    try:
-        # Query vector database 
-        similar_incidents = query_vector_db(incident_summary, limit=3)
-        
-        # Check if any similar incident has high similarity score
-        for similar in similar_incidents:
-            if similar["score"] >= similarity_threshold:
-                batch_logger.info(f"SIMILAR FOUND: {similar['score']:.3f}")
-                return True
-        
-        highest_score = max([s["score"] for s in similar_incidents]) if similar_incidents else 0
-        batch_logger.info(f"NEW (highest: {highest_score:.3f})")
-        return False
-        
-    except Exception as e:
-        batch_logger.error(f"DB check failed: {e}")
-        return False  # If check fails, assume it's new
+    vectors = []
+    for i in range(0, len(descriptions), BATCH_EMBEDDING_BATCH_SIZE):
+        vectors.extend(get_embeddings(descriptions[i:i + BATCH_EMBEDDING_BATCH_SIZE]))
+    
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if len(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+    return matrix
 
-def process_closed_incident(incident: Dict[str, Any], similarity_threshold: float = 0.70) -> Dict[str, Any]:
+def search_best_matches(matrix: np.ndarray) -> List[Optional[Dict[str, Any]]]:
     """
-    Process a closed incident to generate a solution entry
+    Best match in the vector database for each vector, in a single batch search
     """
-    try:
+    search_requests = [
+        models.SearchRequest(vector=vector.tolist(), limit=1, params=get_search_params(), with_payload=True)
+        for vector in matrix
+    ]
+    results = get_breaker("qdrant").call(
+        get_qdrant_client().search_batch, collection_name="incidencias", requests=search_requests
+    )
+    return [
+        {"id": str(hits[0].id), "score": hits[0].score, "descripcion": hits[0].payload.get("DESCRIPCION")}
+        if hits else None
+        for hits in results
+    ]
+
+def check_incidents_exist_in_db(incidents: List[Dict[str, Any]], executor: ThreadPoolExecutor,
+                                similarity_threshold: float = CRITIC_APPROVAL_THRESHOLD):
+    """
+    Bulk existence check: embeds descriptions and searches the vector database in batches.
+    Returns the description vector, the best match and whether it is new for each incident.
+    Incidents whose batch could not be embedded get None as vector and as is_new (unchecked).
+    """
+    def check_batch(start):
+        batch = incidents[start:start + BATCH_EMBEDDING_BATCH_SIZE]
+        with search_slots:
+            try:
+                matrix = embed_descriptions([incident["descripcion"] for incident in batch])
+            except Exception as e:
+                batch_logger.error(f"Embedding failed, batch left unchecked: {e}", extra_data={
+                    "action": "embedding_failed",
+                    "incident_codes": [incident["codIncidencia"] for incident in batch],
+                    "error": str(e)
+                })
+                return [None] * len(batch), [None] * len(batch), [None] * len(batch)
+            try:
+                matches = search_best_matches(matrix)
+            except Exception as e:
+                batch_logger.error(f"DB check failed: {e}")
+                matches = [None] * len(batch)  # If check fails, assume they are new
+            return list(matrix), matches, [True] * len(batch)
+    
+    vectors, matches, checked = [], [], []
+    for batch_vectors, batch_matches, batch_checked in executor.map(
+            check_batch, range(0, len(incidents), BATCH_EMBEDDING_BATCH_SIZE)):
+        vectors.extend(batch_vectors)
+        matches.extend(batch_matches)
+        checked.extend(batch_checked)
+    
+    is_new = []
+    for incident, match, was_checked in zip(incidents, matches, checked):
         incident_code = incident['codIncidencia']
-        batch_logger.info(f"Processing: {incident_code}")
-        
-        # Simple description - use original description
-        description = incident["descripcion"]
-        
-        # Check if incident already exists in vector database
-        if check_if_incident_exists_in_db(description, similarity_threshold):
-            batch_logger.info(f"EXISTS - Skipping: {incident_code}")
-            return None
-        
-        batch_logger.info(f"NEW - Processing: {incident_code}")
-        
+        if not was_checked:
+            batch_logger.info(f"UNCHECKED - Retried next run: {incident_code}")
+            is_new.append(None)
+        elif match is not None and match["score"] >= similarity_threshold:
+            batch_logger.info(f"EXISTS - Skipping: {incident_code} (similar {match['id']}: {match['score']:.3f})")
+            is_new.append(False)
+        else:
+            highest_score = match["score"] if match else 0
+            batch_logger.info(f"NEW - Candidate: {incident_code} (highest: {highest_score:.3f})")
+            is_new.append(True)
+    
+    return vectors, matches, is_new
+
+def cluster_incidents(matrix: np.ndarray, threshold: float = MAINTENANCE_CLUSTER_THRESHOLD) -> List[List[int]]:
+    """
+    Group near-duplicate incidents by cosine similarity.
+    Greedy in input order: the first unassigned incident leads a cluster with every
+    unassigned incident at least `threshold` similar to it.
+    """
+    if not len(matrix):
+        return []
+    
+    similarity = matrix @ matrix.T
+    assigned = np.zeros(len(matrix), dtype=bool)
+    clusters = []
+    for leader in range(len(matrix)):
+        if assigned[leader]:
+            continue
+        members = np.flatnonzero(~assigned & (similarity[leader] >= threshold))
+        members = [leader] + [int(m) for m in members if m != leader]
+        assigned[members] = True
+        clusters.append(members)
+    return clusters
+
+def generate_solution_entry(incident: Dict[str, Any], member_codes: List[str]) -> Dict[str, Any]:
+    """
+    Generate the solution entry of a cluster from its leading closed incident
+    """
+    incident_code = incident['codIncidencia']
+    solution_response = None
+    solution_data = None
+    
+    try:
         # Generate solution suggestion 
         try:
-            solution_response = suggest_solution(incident)
+            with llm_slots:
+                solution_response = suggest_solution(incident)
             solution_data = simple_json_parse(solution_response, batch_logger)
+            solution_origin = "llm"
             
             if not solution_data:
                 # Create default solution if LLM fails
@@ -68,8 +158,7 @@ def process_closed_incident(incident: Dict[str, Any], similarity_threshold: floa
                 "incident_code": incident_code,
                 "incidencia": incident,
                 "solution_response": solution_response,
-                "solution_data": solution_data,
-                "error": str(e)
+                "solution_data": solution_data
             })
                 solution_data = {
                     "COMPONENTE": "General",
@@ -78,6 +167,7 @@ def process_closed_incident(incident: Dict[str, Any], similarity_threshold: floa
                     "RESOLUCION AUTOMÁTICA": "manual",
                     "BUZON REASIGNACION": ""
                 }
+                solution_origin = "por defecto"
         except Exception as e:
             batch_logger.error(f"Solution generation failed: {incident_code} - {e}", extra_data={
                 "action": "solution_generation_failed",
@@ -95,29 +185,160 @@ def process_closed_incident(incident: Dict[str, Any], similarity_threshold: floa
                 "RESOLUCION AUTOMÁTICA": "manual", 
                 "BUZON REASIGNACION": ""
             }
+            solution_origin = "por defecto"
         
         # Prepare CSV entry - simple
         csv_entry = {
             "COMPONENTE": solution_data.get("COMPONENTE", "General"),
-            "DESCRIPCION": description,
+            "DESCRIPCION": incident["descripcion"],
             "TIPO INCIDENCIA": solution_data.get("TIPO INCIDENCIA", "General"),
             "SOLUCIÓN": solution_data.get("SOLUCIÓN", "Revisar manualmente"),
             "FECHA DE RESOLUCIÓN": None,
             "RESOLUCION AUTOMÁTICA": solution_data.get("RESOLUCION AUTOMÁTICA", "manual"),
-            "BUZON REASIGNACION": solution_data.get("BUZON REASIGNACION", "")
+            "BUZON REASIGNACION": solution_data.get("BUZON REASIGNACION", ""),
+            "INCIDENCIAS ORIGEN": "|".join(member_codes),
+            "ORIGEN SOLUCIÓN": solution_origin
         }
         
-        batch_logger.info(f"SUCCESS: {incident_code} - {csv_entry['RESOLUCION AUTOMÁTICA']}")
+        batch_logger.info(f"SUCCESS: {incident_code} ({len(member_codes)} incidents) - {csv_entry['RESOLUCION AUTOMÁTICA']}")
         return csv_entry
         
     except Exception as e:
-        batch_logger.error(f"FAILED: {incident['codIncidencia']} - {e}")
+        batch_logger.error(f"FAILED: {incident_code} - {e}")
         return None
 
+def load_watermark() -> Dict[str, Any]:
+    """
+    Load the watermark of the last run: latest closing date processed and the incident
+    codes already evaluated at that date.
+    """
+    try:
+        with open(MAINTENANCE_WATERMARK_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"fecha_cierre": None, "codigos": []}
+
+def save_watermark(watermark: Dict[str, Any]):
+    """Save the watermark atomically."""
+    tmp_path = f"{MAINTENANCE_WATERMARK_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(watermark, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, MAINTENANCE_WATERMARK_FILE)
+
+def advance_watermark(watermark: Dict[str, Any], incidents: List[Dict[str, Any]],
+                      failed: List[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """
+    Move the watermark to the latest closing date among the evaluated incidents, but never
+    past a failed one, so failed incidents are fetched again on the next run.
+    The evaluated codes at or after the new date are kept so the next run (since >= date) skips them.
+    """
+    previous = datetime.fromisoformat(watermark["fecha_cierre"]) if watermark.get("fecha_cierre") else None
+    closing_dates = {inc["codIncidencia"]: get_fecha_cierre(inc) for inc in incidents}
+    
+    dated = [closed_at for closed_at in closing_dates.values() if closed_at is not None]
+    latest = max(dated + ([previous] if previous else []), default=None)
+    
+    failed_dates = [closed_at for closed_at in (get_fecha_cierre(inc) for inc in failed) if closed_at is not None]
+    if failed_dates and latest is not None:
+        latest = min([latest] + failed_dates)
+    
+    codes = {code for code, closed_at in closing_dates.items() if closed_at is not None and closed_at >= latest}
+    if latest == previous:
+        codes |= set(watermark.get("codigos", []))
+    
+    return {
+        "fecha_cierre": latest.isoformat(timespec="seconds") if latest else None,
+        "codigos": sorted(codes),
+        "actualizado": datetime.now().isoformat()
+    }
+
+def merge_into_catalog(entries: List[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Merge approved entries (solution generated by the LLM) into the master catalogue:
+    append them to PROBLEMAS_GLOBALES.csv and upsert them into the active collection with
+    the same deterministic ids batch.py uses, so a later `batch.py --delta` sees them as unchanged.
+    """
+    approved = [entry for entry in entries if entry.get("ORIGEN SOLUCIÓN") == "llm"]
+    catalog_columns = list(pd.read_csv(MASTER_CATALOG_FILE, nrows=0).columns)
+    
+    # Same normalization as batch.py when reading the CSV (dtype=str, empty -> None)
+    known_hashes = set()
+    for df_chunk in pd.read_csv(MASTER_CATALOG_FILE, chunksize=BATCH_CSV_CHUNK_SIZE, dtype=str):
+        known_hashes.update(row_content_hash(clean_metadata(row)) for row in df_chunk.to_dict("records"))
+    
+    rows = []
+    for entry in approved:
+        metadata = {
+            col: None if entry.get(col) in (None, "") else str(entry[col])
+            for col in catalog_columns
+        }
+        content_hash = row_content_hash(metadata)
+        if content_hash not in known_hashes:
+            known_hashes.add(content_hash)
+            rows.append((content_hash, metadata))
+    
+    result = {
+        "aprobadas": len(approved),
+        "ya_en_catalogo": len(approved) - len(rows),
+        "fusionadas": 0 if dry_run else len(rows),
+        "simulacion": dry_run
+    }
+    
+    if dry_run or not rows:
+        batch_logger.info(f"Merge {'(dry run) ' if dry_run else ''}- {len(rows)} entries to merge", extra_data={
+            "action": "catalog_merge_skipped",
+            **result
+        })
+        return result
+    
+    # Append to the master CSV first: if the upsert fails, `batch.py --delta` indexes the rows later
+    with open(MASTER_CATALOG_FILE, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    pd.DataFrame([metadata for _, metadata in rows], columns=catalog_columns).to_csv(
+        MASTER_CATALOG_FILE, mode="a", header=False, index=False, encoding="utf-8"
+    )
+    
+    client, collection_name = open_vector_db()
+    # The legacy unversioned collection has no sparse vectors: upload dense-only points there
+    lexical = has_lexical_vectors(client, collection_name)
+    source_file = os.path.basename(MASTER_CATALOG_FILE)
+    with ThreadPoolExecutor(max_workers=BATCH_SUMMARY_WORKERS) as executor:
+        summaries = list(executor.map(summarize_row, [metadata for _, metadata in rows], range(len(rows))))
+    vectors = embed_summaries(summaries)
+    points = [
+        build_point(metadata, content_hash, source_file, summary, vector, lexical)
+        for (content_hash, metadata), summary, vector in zip(rows, summaries, vectors)
+    ]
+    for i in range(0, len(points), BATCH_UPSERT_CHUNK_SIZE):
+        client.upsert(collection_name=collection_name, points=points[i:i + BATCH_UPSERT_CHUNK_SIZE], wait=True)
+    
+    result["coleccion"] = collection_name
+    result["version_coleccion"] = bump_collection_version()
+    batch_logger.info(f"Merged {len(rows)} entries into {collection_name}", extra_data={
+        "action": "catalog_merge_complete",
+        **result
+    })
+    return result
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mantenimiento de problemas globales a partir de incidencias cerradas")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignora la marca de agua y revisa todo el histórico de incidencias cerradas")
+    parser.add_argument("--merge", action="store_true",
+                        help="Añade las soluciones aprobadas al catálogo maestro y a la colección sin reindexar")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Simula la ejecución: no fusiona en el catálogo ni guarda la marca de agua")
+    return parser.parse_args()
+
 def main():
     """
     Main function to process closed incidents and generate new problems CSV.
     """
+    args = parse_args()
     start_time = time.time()
     
     # Configuration 
@@ -127,36 +348,67 @@ def main():
     batch_logger.info(f"Threshold: {SIMILARITY_THRESHOLD}")
     
     try:
-        # Generate filename
-        current_date = datetime.now().strftime("%Y%m%d")
-        output_filename = f"resources/PROBLEMAS_GLOBALES_{current_date}.csv"
+        # Generate filename - one per run: incremental runs only see new closures, so a later
+        # run on the same day must not overwrite the suggestions of an earlier one
+        run_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_filename = f"resources/PROBLEMAS_GLOBALES_{run_timestamp}.csv"
         batch_logger.info(f"Output: {output_filename}")
         
-        # Get closed incidents
-        batch_logger.info("Fetching closed incidents...")
-        closed_incidents = get_incidencias_cerradas()
-        total_incidents = len(closed_incidents)
-        batch_logger.info(f"Found: {total_incidents} closed incidents")
+        # Get closed incidents since the last watermark
+        watermark = {"fecha_cierre": None, "codigos": []} if args.full else load_watermark()
+        since = datetime.fromisoformat(watermark["fecha_cierre"]) if watermark.get("fecha_cierre") else None
+        batch_logger.info(f"Fetching closed incidents since {since or 'the beginning'}...")
+        fetched_incidents = get_incidencias_cerradas(desde=since)
         
-        # Process each closed incident - simple
-        new_entries = []
+        # Skip incidents already evaluated in a previous run
+        evaluated_codes = set(watermark.get("codigos", []))
+        closed_incidents = [inc for inc in fetched_incidents if inc["codIncidencia"] not in evaluated_codes]
+        skipped_incidents = len(fetched_incidents) - len(closed_incidents)
+        total_incidents = len(closed_incidents)
+        batch_logger.info(f"Found: {total_incidents} closed incidents ({skipped_incidents} already evaluated)")
         
-        for i, incident in enumerate(closed_incidents, 1):
-            batch_logger.info(f"=== {i}/{total_incidents} ===")
+        processing_start = time.time()
+        with ThreadPoolExecutor(max_workers=MAINTENANCE_WORKERS) as executor:
+            # Bulk existence check - results keep the input order
+            vectors, matches, is_new = check_incidents_exist_in_db(closed_incidents, executor, SIMILARITY_THRESHOLD)
+            candidate_rows = [i for i, new in enumerate(is_new) if new]
+            candidates = [closed_incidents[i] for i in candidate_rows]
+            unchecked_codes = {closed_incidents[i]["codIncidencia"] for i, new in enumerate(is_new) if new is None}
+            
+            # Group near-duplicate candidates: one suggestion per cluster
+            clusters = cluster_incidents(np.stack([vectors[i] for i in candidate_rows])) if candidate_rows else []
+            batch_logger.info(f"Candidates: {len(candidates)} in {len(clusters)} clusters")
             
-            result = process_closed_incident(incident, SIMILARITY_THRESHOLD)
+            def generate_for_cluster(members):
+                codes = [candidates[m]["codIncidencia"] for m in members]
+                return generate_solution_entry(candidates[members[0]], codes)
             
-            if result is not None:
-                new_entries.append(result)
+            results = list(executor.map(generate_for_cluster, clusters))
+        processing_time = time.time() - processing_start
+        
+        new_entries = [result for result in results if result is not None]
+        
+        # Incidents of clusters without an entry, and unchecked ones, are left out of the watermark to retry them
+        failed_codes = unchecked_codes | {
+            candidates[m]["codIncidencia"]
+            for members, result in zip(clusters, results) if result is None
+            for m in members
+        }
+        failed_incidents = [inc for inc in closed_incidents if inc["codIncidencia"] in failed_codes]
+        evaluated_incidents = [inc for inc in closed_incidents if inc["codIncidencia"] not in failed_codes]
+        new_watermark = advance_watermark(watermark, evaluated_incidents, failed_incidents)
         
         # Results
         total_time = time.time() - start_time
         porcentaje = round((len(new_entries) / total_incidents) * 100, 1) if total_incidents > 0 else 0
+        throughput = round(total_incidents / processing_time, 3) if processing_time > 0 else 0
         
         batch_logger.info(f"=== RESULTS ===")
         batch_logger.info(f"Processed: {total_incidents}")
         batch_logger.info(f"New entries: {len(new_entries)} ({porcentaje}%)")
+        batch_logger.info(f"Duplicates merged: {len(candidates) - len(clusters)}")
         batch_logger.info(f"Time: {total_time:.1f}s")
+        batch_logger.info(f"Throughput: {throughput} incidents/s ({MAINTENANCE_WORKERS} workers)")
         
         # Generate files if we have new entries
         if new_entries:
@@ -165,16 +417,36 @@ def main():
             df.to_csv(output_filename, index=False, encoding='utf-8')
             batch_logger.info(f"CSV: {output_filename}")
             
+            # Direct merge into the knowledge base
+            merge_result = merge_into_catalog(new_entries, args.dry_run) if args.merge else None
+            
             # Simple report
-            report_filename = f"resources/reporte_mantenimiento_globales_{current_date}.json"
+            report_filename = f"resources/reporte_mantenimiento_globales_{run_timestamp}.json"
             report_data = {
                 "fecha": datetime.now().isoformat(),
                 "umbral_similitud": SIMILARITY_THRESHOLD,
                 "procesadas": total_incidents,
                 "nuevas": len(new_entries),
+                "existentes": total_incidents - len(candidates) - len(unchecked_codes),
+                "sin_comprobar": len(unchecked_codes),
+                "candidatas": len(candidates),
+                "grupos": len(clusters),
+                "duplicadas_agrupadas": len(candidates) - len(clusters),
+                "umbral_agrupacion": MAINTENANCE_CLUSTER_THRESHOLD,
+                "coincidencias": {
+                    incident["codIncidencia"]: match
+                    for incident, match in zip(closed_incidents, matches)
+                },
                 "porcentaje": porcentaje,
                 "tiempo_segundos": round(total_time, 1),
-                "archivo": output_filename
+                "trabajadores": MAINTENANCE_WORKERS,
+                "incidencias_por_segundo": throughput,
+                "omitidas_ya_evaluadas": skipped_incidents,
+                "marca_agua_desde": watermark.get("fecha_cierre"),
+                "marca_agua_hasta": new_watermark["fecha_cierre"],
+                "fallidas": sorted(failed_codes),
+                "archivo": output_filename,
+                "fusion_catalogo": merge_result
             }
             
             with open(report_filename, "w", encoding="utf-8") as f:
@@ -184,6 +456,11 @@ def main():
         else:
             batch_logger.info("No new entries found - no files generated")
         
+        # Persist the new watermark only once the outputs are written
+        if not args.dry_run:
+            save_watermark(new_watermark)
+        batch_logger.info(f"Watermark: {new_watermark['fecha_cierre']} ({len(failed_codes)} failed, retried next run)")
+        
     except Exception as e:
         batch_logger.error(f"FATAL ERROR: {e}")
         raise
@@ -0,0 +1,64 @@
+"""Comprobación de las variantes asíncronas de las APIs contra los mocks (gestor y sistema).
+
+Ejecuta las mismas consultas de solo lectura con la versión síncrona y la asíncrona y comprueba que
+devuelven lo mismo, incluida la paginación por cursor. Requiere los mocks levantados
+(docker-compose up mock-gestor-incidencias mock-sistema). Sale con código 1 si alguna difiere.
+"""
+import asyncio
+import sys
+from datetime import datetime
+from api.http_client import close_async_client
+from api.gestor_incidencias import (get_incidencias, get_incidencias_async, get_incidencias_cerradas,
+                                    get_incidencias_cerradas_async, iter_incidencias, aiter_incidencias)
+from api.sistema import get_poliza, get_poliza_async, comprobacion_poliza, comprobacion_poliza_async
+
+POLIZA = "POL001-FX-PROVISION"
+COD_SOLUCION = "fxprovicion"
+DESDE = datetime(2024, 1, 1)
+
+
+async def run_async():
+    """Resultados de las variantes asíncronas (las consultas del gestor y del sistema en paralelo)."""
+    try:
+        resultados = await asyncio.gather(
+            get_incidencias_async(),
+            get_incidencias_cerradas_async(),
+            get_incidencias_cerradas_async(desde=DESDE),
+            get_poliza_async(POLIZA),
+            comprobacion_poliza_async(POLIZA, COD_SOLUCION, "{}")
+        )
+        # Páginas de una incidencia para forzar varias peticiones con cursor
+        paginadas = [incidencia async for incidencia in aiter_incidencias(page_size=1)]
+        return list(resultados) + [paginadas]
+    finally:
+        await close_async_client()
+
+
+def main():
+    esperados = [
+        get_incidencias(),
+        get_incidencias_cerradas(),
+        get_incidencias_cerradas(desde=DESDE),
+        get_poliza(POLIZA),
+        comprobacion_poliza(POLIZA, COD_SOLUCION, "{}"),
+        list(iter_incidencias(page_size=1))
+    ]
+    obtenidos = asyncio.run(run_async())
+
+    nombres = ["get_incidencias", "get_incidencias_cerradas", "get_incidencias_cerradas(desde)",
+               "get_poliza", "comprobacion_poliza", "get_incidencias (page_size=1)"]
+    fallos = 0
+    for nombre, esperado, obtenido in zip(nombres, esperados, obtenidos):
+        ok = esperado == obtenido
+        fallos += not ok
+        detalle = f"{len(esperado)} elementos" if isinstance(esperado, list) else "respuesta idéntica"
+        print(f"{'OK   ' if ok else 'FALLO'} {nombre}: {detalle if ok else 'la versión asíncrona difiere'}")
+
+    if esperados[0] and esperados[0] != esperados[5]:
+        fallos += 1
+        print("FALLO paginación: page_size=1 no devuelve las mismas incidencias que la consulta completa")
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
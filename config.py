@@ -14,6 +14,47 @@ MOCK_SISTEMA_URL = os.getenv("MOCK_SISTEMA_URL", "http://localhost:3002")
 VECTOR_DB_URL = os.getenv("VECTOR_DB_URL", "http://localhost:6333")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
+# Cliente HTTP de las APIs de gestor y sistema
+HTTP_CONNECT_TIMEOUT = 3.05  # Segundos para establecer la conexión
+HTTP_READ_TIMEOUT = 30  # Segundos de espera de la respuesta
+HTTP_POOL_MAXSIZE = 10  # Conexiones reutilizables por host
+HTTP_MAX_RETRIES = 3  # Reintentos de las llamadas idempotentes
+HTTP_BACKOFF_BASE = 0.5  # Segundos del primer reintento (se duplica en cada intento, con jitter)
+HTTP_BACKOFF_MAX = 8  # Espera máxima entre reintentos
+GESTOR_PAGE_SIZE = 50  # Incidencias por página en los listados del gestor
+GESTOR_SYSTEM_AUTHOR = "Sistema Automático"  # Autor de las entradas del historial que añaden nuestras acciones
+
+# Procesamiento de incidencias en main
+INCIDENT_WORKERS = int(os.getenv("INCIDENT_WORKERS", "4"))  # Incidencias procesadas a la vez (1 = secuencial)
+STAGE_PARALLELISM = 3  # Etapas independientes de una misma incidencia ejecutadas a la vez
+DAEMON_POLL_SECONDS = float(os.getenv("DAEMON_POLL_SECONDS", "60"))  # Intervalo entre consultas al gestor en modo daemon
+DAEMON_STATE_FILE = "resources/daemon_estado.json"  # Huellas de las incidencias ya procesadas por el daemon
+METRICS_WINDOW_SIZE = 10000  # Muestras de latencia y errores recientes que guardan las métricas
+
+# Cola write-behind de acciones sobre el gestor
+USE_WRITE_BEHIND = os.getenv("USE_WRITE_BEHIND", "false").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = 20  # Acciones por petición bulk
+WRITE_BEHIND_FLUSH_SECONDS = 2.0  # Espera máxima antes de enviar un lote incompleto
+WRITE_BEHIND_MAX_ATTEMPTS = 5  # Envíos fallidos antes de dejar la acción pendiente en el journal
+WRITE_BEHIND_FLUSH_TIMEOUT = 120  # Segundos que main espera a que se confirmen las acciones al terminar
+WRITE_BEHIND_JOURNAL_FILE = "resources/write_behind_journal.jsonl"
+WRITE_BEHIND_MAX_RESULTS = 10000  # Resultados de acciones aún sin leer que se conservan (los más recientes)
+
+# Caché de consultas al sistema de pólizas
+USE_POLICY_CACHE = True
+POLICY_CACHE_TTL_SECONDS = 300  # Vida de una respuesta cacheada
+POLICY_CACHE_MAX_ENTRIES = 1024  # Entradas máximas por caché (LRU)
+POLICY_CACHE_KEYWORDS = ["DNI", "NIF", "idServicios"]  # Palabras clave que forman parte de la clave de caché
+
+# Circuit breakers por dependencia externa
+CIRCUIT_BREAKER_WINDOW = 20  # Llamadas recientes consideradas
+CIRCUIT_BREAKER_MIN_CALLS = 5  # Llamadas mínimas en la ventana antes de poder abrir el circuito
+CIRCUIT_BREAKER_FAILURE_RATE = 0.5  # Tasa de errores que abre el circuito
+CIRCUIT_BREAKER_SLOW_RATE = 0.8  # Tasa de llamadas lentas que abre el circuito
+CIRCUIT_BREAKER_SLOW_CALL_SECONDS = {"gestor": 5, "sistema": 5, "qdrant": 2, "llm": 60}  # Llamada lenta por dependencia
+CIRCUIT_BREAKER_OPEN_SECONDS = 30  # Tiempo abierto antes de probar la recuperación
+CIRCUIT_BREAKER_HALF_OPEN_CALLS = 2  # Llamadas de prueba correctas necesarias para cerrar el circuito
+
 # Configuración de LLM
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 LLM_MODEL_DESA = "gemma3"
@@ -28,5 +69,60 @@ LLM_MODEL_EMBEDDING_PROD = "text-embedding-ada-002"
 MAX_RETRIES_CRITIC = 2
 QUERY_LIMIT_VECTORDB = 2
 
+# Fusión de resultados entre versiones reformuladas
+FUSION_METHOD = "rrf"  # "rrf" (reciprocal rank fusion) o "max" (mejor score)
+FUSION_RRF_K = 60
+FUSION_TOP_K = 4  # Soluciones deduplicadas que pasan a la comprobación de relevancia
+
+# Cuantización de vectores en la colección de incidencias
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")  # none, scalar (int8) o binary
+QUANTIZATION_ALWAYS_RAM = True  # Vectores cuantizados en RAM, originales en disco
+QUANTIZATION_RESCORE = True  # Reordena los candidatos con los vectores originales
+QUANTIZATION_OVERSAMPLING = 2.0
+
+# Colecciones versionadas (blue/green): las búsquedas usan el alias
+COLLECTION_ALIAS = "incidencias"
+BLUE_GREEN_KEEP_COLLECTIONS = 2  # Activa + anterior para rollback
+COLLECTION_HISTORY_FILE = "resources/colecciones_publicadas.json"  # Colecciones publicadas tras el alias, en orden
+
+# Ingesta del catálogo (batch.py)
+BATCH_SUMMARY_WORKERS = 4  # Resúmenes generados en paralelo con el LLM
+BATCH_EMBEDDING_BATCH_SIZE = 32  # Textos por petición de embeddings
+BATCH_UPSERT_CHUNK_SIZE = 64  # Puntos por upsert
+BATCH_CSV_CHUNK_SIZE = 1000  # Filas leídas del CSV por bloque
+BATCH_CHECKPOINT_FILE = "resources/batch_checkpoint.json"
+
+# Batch de mantenimiento de problemas globales
+MAINTENANCE_WORKERS = int(os.getenv("MAINTENANCE_WORKERS", "4"))  # Incidencias cerradas procesadas a la vez
+MAINTENANCE_SEARCH_CONCURRENCY = 4  # Lotes de embeddings + búsquedas simultáneos
+MAINTENANCE_LLM_CONCURRENCY = 2  # Sugerencias de solución simultáneas
+MAINTENANCE_WATERMARK_FILE = "resources/mantenimiento_watermark.json"  # Última fecha de cierre procesada
+MAINTENANCE_CLUSTER_THRESHOLD = 0.90  # Similitud coseno a partir de la cual dos incidencias nuevas se agrupan
+
+# Bandas de similitud para la comprobación de relevancia
+RELEVANCE_SCORE_FLOOR = 0.35  # Por debajo se descarta sin llamar al LLM
+RELEVANCE_SCORE_CEILING = 0.90  # Por encima se acepta sin llamar al LLM
+RELEVANCE_LEXICAL_EXEMPT = 0.80  # Score léxico normalizado a partir del cual no se aplica el mínimo
+
+# Réplica local en memoria de la colección de incidencias
+USE_LOCAL_INDEX = os.getenv("USE_LOCAL_INDEX", "false").lower() == "true"
+LOCAL_INDEX_REFRESH_SECONDS = 60  # Cada cuánto se comprueba el número de puntos en Qdrant
+LOCAL_INDEX_HNSW_THRESHOLD = 50000  # A partir de este tamaño se usa HNSW (si hnswlib está instalado)
+COLLECTION_VERSION_FILE = "resources/incidencias.version"
+
+# Caché de resultados de búsqueda (se invalida al cambiar la versión de la colección)
+USE_QUERY_CACHE = True
+QUERY_CACHE_MAX_ENTRIES = 512
+QUERY_CACHE_TTL_SECONDS = 900
+
+# Búsqueda híbrida: léxica (BM25 sobre vectores dispersos) + densa
+USE_HYBRID_SEARCH = True
+HYBRID_DENSE_WEIGHT = 0.7
+HYBRID_LEXICAL_WEIGHT = 0.3
+HYBRID_CANDIDATES_FACTOR = 3  # Candidatos por búsqueda = límite * factor
+LEXICAL_VECTOR_NAME = "lexical"
+LEXICAL_FIELDS = ["DESCRIPCION", "SOLUCIÓN", "COMPONENTE"]
+BM25_K1 = 1.2
+
 # Umbrales de métricas
 CRITIC_APPROVAL_THRESHOLD = 65  # % mínimo de aprobación del crítico 
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""Circuit breakers por dependencia externa (gestor, sistema, qdrant, llm)."""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict
+from core.metrics import system_metrics
+from observabilidad.logger import main_logger
+from config import (CIRCUIT_BREAKER_WINDOW, CIRCUIT_BREAKER_MIN_CALLS, CIRCUIT_BREAKER_FAILURE_RATE,
+                    CIRCUIT_BREAKER_SLOW_RATE, CIRCUIT_BREAKER_SLOW_CALL_SECONDS, CIRCUIT_BREAKER_OPEN_SECONDS,
+                    CIRCUIT_BREAKER_HALF_OPEN_CALLS)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """La dependencia tiene el circuito abierto: la llamada se rechaza sin esperar."""
+
+    def __init__(self, dependency: str):
+        super().__init__(f"Circuito abierto para {dependency}, dependencia no disponible")
+        self.dependency = dependency
+
+
+def is_dependency_failure(error: Exception) -> bool:
+    """
+    Indica si un error refleja un problema de la dependencia. Los 4xx (salvo 429) son errores de la
+    petición, p. ej. buscar por un vector disperso en una colección que no lo tiene, y no cuentan.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de errores y de llamadas lentas sobre una ventana de llamadas recientes.
+
+    Se abre cuando, con al menos min_calls llamadas en la ventana, la tasa de errores o de llamadas
+    lentas supera su umbral. Abierto rechaza las llamadas durante open_seconds y después pasa a
+    semiabierto, donde deja pasar half_open_calls llamadas de prueba: si todas van bien se cierra y
+    si alguna falla (o es lenta) vuelve a abrirse.
+    """
+
+    def __init__(self, name: str, slow_call_seconds: float, window_size: int = CIRCUIT_BREAKER_WINDOW,
+                 min_calls: int = CIRCUIT_BREAKER_MIN_CALLS, failure_rate: float = CIRCUIT_BREAKER_FAILURE_RATE,
+                 slow_rate: float = CIRCUIT_BREAKER_SLOW_RATE, open_seconds: float = CIRCUIT_BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = CIRCUIT_BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._window = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        system_metrics.record_circuit_state(name, CLOSED)
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _transition(self, state: str, reason: str):
+        """Cambia de estado (con el lock tomado) y lo registra en métricas y log."""
+        previous, self._state = self._state, state
+        if state == OPEN:
+            self._opened_at = time.time()
+        if state == HALF_OPEN:
+            self._probes = 0
+            self._probe_successes = 0
+        if state == CLOSED:
+            self._window.clear()
+        system_metrics.record_circuit_state(self.name, state)
+        log = main_logger.warning if state == OPEN else main_logger.info
+        log(f"Circuito {self.name}: {previous} -> {state}", extra_data={
+            "action": "circuit_breaker_transition",
+            "dependency": self.name,
+            "from_state": previous,
+            "to_state": state,
+            "reason": reason
+        })
+
+    def before_call(self):
+        """Comprueba si la llamada puede hacerse; lanza CircuitOpenError si el circuito la rechaza."""
+        with self._lock:
+            if self._state == OPEN and time.time() - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN, "open_timeout_elapsed")
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            if self._state == CLOSED:
+                return
+        system_metrics.record_circuit_rejection(self.name)
+        raise CircuitOpenError(self.name)
+
+    def record(self, seconds: float, failed: bool):
+        """Registra el resultado de una llamada permitida por before_call."""
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._transition(OPEN, "probe_failed" if failed else "probe_slow")
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._transition(CLOSED, "probes_succeeded")
+                return
+            if self._state != CLOSED:
+                return
+
+            self._window.append((failed, slow))
+            if len(self._window) < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._window if f) / len(self._window)
+            slow_calls = sum(1 for _, s in self._window if s) / len(self._window)
+            if failures >= self.failure_rate:
+                self._transition(OPEN, f"failure_rate {failures:.2f}")
+            elif slow_calls >= self.slow_rate:
+                self._transition(OPEN, f"slow_call_rate {slow_calls:.2f}")
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Ejecuta fn protegida por el circuito (las excepciones cuentan como fallo salvo los errores de la petición)."""
+        self.before_call()
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(time.perf_counter() - start, is_dependency_failure(e))
+            raise
+        self.record(time.perf_counter() - start, False)
+        return result
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    """Circuit breaker de una dependencia (se crea en el primer uso)."""
+    with _breakers_lock:
+        breaker = _breakers.get(dependency)
+        if breaker is None:
+            slow_call_seconds = CIRCUIT_BREAKER_SLOW_CALL_SECONDS.get(dependency, max(CIRCUIT_BREAKER_SLOW_CALL_SECONDS.values()))
+            breaker = _breakers[dependency] = CircuitBreaker(dependency, slow_call_seconds)
+        return breaker
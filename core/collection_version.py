@@ -0,0 +1,26 @@
+"""Marcador de versión de la colección de incidencias."""
+
+import os
+import uuid
+from datetime import datetime
+from config import COLLECTION_VERSION_FILE
+
+
+def get_collection_version() -> str:
+    """Obtiene la versión actual de la colección ("" si nunca se ha marcado)."""
+    try:
+        with open(COLLECTION_VERSION_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_collection_version() -> str:
+    """Marca la colección como modificada generando una nueva versión."""
+    version = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(os.path.dirname(COLLECTION_VERSION_FILE) or ".", exist_ok=True)
+    tmp_path = f"{COLLECTION_VERSION_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, COLLECTION_VERSION_FILE)
+    return version
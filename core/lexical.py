@@ -0,0 +1,55 @@
+"""Índice léxico BM25 del catálogo de soluciones como vectores dispersos."""
+
+import re
+import unicodedata
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+from config import LEXICAL_FIELDS, BM25_K1
+
+STOPWORDS = {
+    "de", "la", "el", "en", "y", "a", "que", "los", "las", "del", "se", "por", "un", "una",
+    "con", "no", "para", "es", "al", "lo", "su", "sus", "como", "mas", "pero", "le", "ya",
+    "o", "este", "esta", "si", "porque", "cuando", "muy", "sin", "sobre", "ha", "me", "nos"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Normaliza (minúsculas, sin acentos) y separa en términos conservando identificadores."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii").lower()
+    return [t for t in re.findall(r"[a-z0-9_]+", text) if len(t) > 1 and t not in STOPWORDS]
+
+
+def term_index(term: str) -> int:
+    """Índice estable del término en el vector disperso."""
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+def document_text(row: Dict[str, Any]) -> str:
+    """Texto indexado léxicamente de una fila del catálogo."""
+    values = []
+    for field in LEXICAL_FIELDS:
+        value = row.get(field)
+        if value is None or value != value:  # None o NaN de pandas
+            continue
+        values.append(str(value))
+    return " ".join(values)
+
+
+def document_sparse_vector(text: str) -> Tuple[List[int], List[float]]:
+    """
+    Pesos BM25 de documento: frecuencia saturada tf * (k1 + 1) / (tf + k1).
+
+    No se normaliza por longitud (b = 0): las entradas del catálogo son cortas y así el peso
+    no depende de estadísticas del corpus. El IDF lo aplica Qdrant (modificador IDF).
+    """
+    tf = Counter(term_index(t) for t in tokenize(text))
+    indices = sorted(tf)
+    values = [tf[i] * (BM25_K1 + 1) / (tf[i] + BM25_K1) for i in indices]
+    return indices, values
+
+
+def query_sparse_vector(text: str) -> Tuple[List[int], List[float]]:
+    """Vector disperso de consulta: cada término distinto con peso 1."""
+    indices = sorted({term_index(t) for t in tokenize(text)})
+    return indices, [1.0] * len(indices)
@@ -0,0 +1,238 @@
+"""Réplica local en memoria de la colección de incidencias."""
+
+import threading
+import time
+from typing import Any, Dict, List
+import numpy as np
+from qdrant_client import QdrantClient
+from observabilidad.logger import main_logger
+from core.collection_version import get_collection_version
+from core.retrieval import SearchHit
+from config import VECTOR_DB_URL, LOCAL_INDEX_REFRESH_SECONDS, LOCAL_INDEX_HNSW_THRESHOLD, LEXICAL_VECTOR_NAME
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class LocalVectorIndex:
+    """Snapshot en memoria de vectores y payloads de Qdrant con búsqueda por coseno."""
+
+    def __init__(self, collection_name: str = "incidencias", refresh_seconds: int = LOCAL_INDEX_REFRESH_SECONDS):
+        self.collection_name = collection_name
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._matrix = None
+        self._hnsw = None
+        self._ids: List[str] = []
+        self._payloads: List[Dict[str, Any]] = []
+        self._postings: Dict[int, tuple] = {}
+        self._version = None
+        self._points_count = None
+        self._last_check = 0.0
+        self._retry_at = 0.0
+
+    def _get_client(self) -> QdrantClient:
+        return QdrantClient(url=VECTOR_DB_URL)
+
+    def load(self):
+        """Descarga todos los puntos de la colección y reconstruye la matriz normalizada."""
+        start_time = time.time()
+        client = self._get_client()
+        version = get_collection_version()
+
+        ids, payloads, vectors = [], [], []
+        postings: Dict[int, tuple] = {}
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self.collection_name,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            for point in points:
+                vector, sparse = point.vector, None
+                if isinstance(vector, dict):
+                    vector, sparse = vector.get(""), vector.get(LEXICAL_VECTOR_NAME)
+                if sparse is not None:
+                    for index, value in zip(sparse.indices, sparse.values):
+                        postings.setdefault(index, ([], []))
+                        postings[index][0].append(len(ids))
+                        postings[index][1].append(value)
+                ids.append(str(point.id))
+                payloads.append(point.payload or {})
+                vectors.append(vector)
+            if offset is None:
+                break
+
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        if len(matrix):
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+
+        postings = {
+            index: (np.asarray(rows, dtype=np.int64), np.asarray(values, dtype=np.float32))
+            for index, (rows, values) in postings.items()
+        }
+
+        hnsw = None
+        if hnswlib is not None and len(matrix) >= LOCAL_INDEX_HNSW_THRESHOLD:
+            hnsw = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+            hnsw.init_index(max_elements=len(matrix), ef_construction=200, M=16)
+            hnsw.add_items(matrix, np.arange(len(matrix)))
+            hnsw.set_ef(64)
+
+        with self._lock:
+            self._matrix = matrix
+            self._hnsw = hnsw
+            self._ids = ids
+            self._payloads = payloads
+            self._postings = postings
+            self._version = version
+            self._points_count = len(ids)
+            self._last_check = time.time()
+
+        main_logger.info(f"Índice local cargado: {len(ids)} puntos", extra_data={
+            "action": "local_index_loaded",
+            "collection_name": self.collection_name,
+            "points": len(ids),
+            "hnsw": hnsw is not None,
+            "lexical_terms": len(postings),
+            "version": version,
+            "load_time_seconds": round(time.time() - start_time, 3)
+        })
+
+    def refresh_if_needed(self):
+        """
+        Recarga el snapshot si cambió la versión de la colección o su número de puntos.
+
+        Solo un hilo recarga a la vez (los demás siguen con el snapshot actual) y tras un error
+        de recarga no se reintenta hasta pasados refresh_seconds.
+        """
+        if self._matrix is None:
+            with self._load_lock:
+                if self._matrix is None:
+                    if time.time() < self._retry_at:
+                        raise RuntimeError("Índice local no cargado, reintento de carga pendiente")
+                    try:
+                        self.load()
+                    except Exception:
+                        self._retry_at = time.time() + self.refresh_seconds
+                        raise
+            return
+
+        if time.time() < self._retry_at:
+            return
+
+        if get_collection_version() != self._version:
+            self._reload_keeping_snapshot("version_changed")
+            return
+
+        if time.time() - self._last_check < self.refresh_seconds:
+            return
+
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            if time.time() - self._last_check < self.refresh_seconds:
+                return
+            self._last_check = time.time()
+            try:
+                points_count = self._get_client().count(collection_name=self.collection_name, exact=True).count
+            except Exception as e:
+                main_logger.warning("No se pudo comprobar la colección, se mantiene el snapshot local", extra_data={
+                    "action": "local_index_check_error",
+                    "collection_name": self.collection_name,
+                    "error": str(e)
+                })
+                return
+        finally:
+            self._load_lock.release()
+
+        if points_count != self._points_count:
+            self._reload_keeping_snapshot("points_count_changed")
+
+    def _reload_keeping_snapshot(self, reason: str):
+        """Recarga el snapshot; si Qdrant no está disponible sigue sirviendo el anterior."""
+        if not self._load_lock.acquire(blocking=False):
+            # Otro hilo ya está recargando: se sirve el snapshot actual
+            return
+        try:
+            if time.time() < self._retry_at:
+                return
+            if reason == "version_changed" and get_collection_version() == self._version:
+                return
+            self.load()
+        except Exception as e:
+            self._last_check = time.time()
+            self._retry_at = self._last_check + self.refresh_seconds
+            main_logger.warning("Error recargando índice local, se mantiene el snapshot anterior", extra_data={
+                "action": "local_index_reload_error",
+                "collection_name": self.collection_name,
+                "reason": reason,
+                "retry_in_seconds": self.refresh_seconds,
+                "error": str(e)
+            })
+        finally:
+            self._load_lock.release()
+
+    def search(self, query_vector: List[float], limit: int) -> List[SearchHit]:
+        """Busca los puntos más similares por coseno (o HNSW en catálogos grandes)."""
+        self.refresh_if_needed()
+
+        with self._lock:
+            matrix, hnsw, ids, payloads = self._matrix, self._hnsw, self._ids, self._payloads
+
+        if not len(matrix) or limit <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        limit = min(limit, len(matrix))
+
+        if hnsw is not None:
+            labels, distances = hnsw.knn_query(query, k=limit)
+            top = labels[0]
+            scores = 1.0 - distances[0]
+            return [SearchHit(ids[i], float(s), payloads[i]) for i, s in zip(top, scores)]
+
+        scores = matrix @ query
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+        return [SearchHit(ids[i], float(scores[i]), payloads[i]) for i in top]
+
+    def search_lexical(self, indices: List[int], limit: int) -> List[SearchHit]:
+        """Busca por BM25 sobre los vectores dispersos (IDF calculado sobre el snapshot)."""
+        self.refresh_if_needed()
+
+        with self._lock:
+            matrix, ids, payloads, postings = self._matrix, self._ids, self._payloads, self._postings
+
+        total = len(ids)
+        if not total or not postings or limit <= 0:
+            return []
+
+        scores = np.zeros(total, dtype=np.float32)
+        for index in indices:
+            if index not in postings:
+                continue
+            rows, values = postings[index]
+            idf = np.log(1.0 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * values
+
+        top = np.flatnonzero(scores)
+        top = top[np.argsort(-scores[top])][:limit]
+        return [SearchHit(ids[i], float(scores[i]), payloads[i], matrix[i]) for i in top]
+
+
+# Instancia global del índice local
+local_index = LocalVectorIndex()
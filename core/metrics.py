@@ -1,77 +1,154 @@
 """Sistema simple de métricas y monitoreo."""
 
+import threading
 import time
 from datetime import datetime
 from typing import Dict, Any
-from collections import defaultdict, Counter
+from collections import defaultdict, deque, Counter
 from observabilidad.logger import main_logger
-from config import CRITIC_APPROVAL_THRESHOLD
+from config import CRITIC_APPROVAL_THRESHOLD, METRICS_WINDOW_SIZE
 
 
 class SystemMetrics:
-    """Métricas del sistema de resolución automática."""
+    """
+    Métricas del sistema de resolución automática (seguras entre hilos).
+    
+    Los totales son acumulados; las latencias y los errores guardan solo las últimas
+    METRICS_WINDOW_SIZE muestras para que la memoria no crezca en el modo daemon.
+    """
     
     def __init__(self):
+        self._lock = threading.RLock()
         self.reset_metrics()
     
     def reset_metrics(self):
         """Reinicia todas las métricas."""
+        with self._lock:
+            self._reset()
+    
+    def _reset(self):
         self.start_time = time.time()
-        self.incident_times = []
+        self.incident_times = deque(maxlen=METRICS_WINDOW_SIZE)
+        self.incidents_completed = 0
         self.resolution_types = Counter()
         self.problem_types = Counter()
         self.api_errors = defaultdict(int)
         self.critic_rejections = 0
         self.critic_approvals = 0
-        self.solutions_found_per_incident = []
-        self.processing_errors = []
+        self.solutions_found = Counter()
+        self.relevance_bands = Counter()
+        self.cache_stats = defaultdict(Counter)
+        self.api_latencies = defaultdict(lambda: deque(maxlen=METRICS_WINDOW_SIZE))
+        self.api_call_stats = defaultdict(Counter)
+        self.stage_latencies = defaultdict(lambda: deque(maxlen=METRICS_WINDOW_SIZE))
+        self.stage_counts = Counter()
+        self.circuit_states = {}
+        self.circuit_stats = defaultdict(Counter)
+        self.processing_errors = deque(maxlen=METRICS_WINDOW_SIZE)
+        self.processing_error_count = 0
+        self._incidents_in_progress = {}
     
     def record_incident_start(self, incident_code: str):
         """Registra el inicio del procesamiento de una incidencia."""
-        self._current_incident = {
-            "code": incident_code,
-            "start_time": time.time()
-        }
+        with self._lock:
+            self._incidents_in_progress[incident_code] = time.time()
     
-    def record_incident_end(self, resolution_type: str):
+    def record_incident_end(self, incident_code: str, resolution_type: str):
         """Registra el fin del procesamiento de una incidencia."""
-        if hasattr(self, '_current_incident'):
-            processing_time = time.time() - self._current_incident["start_time"]
-            self.incident_times.append(processing_time)
-            self.resolution_types[resolution_type] += 1
+        with self._lock:
+            start_time = self._incidents_in_progress.pop(incident_code, None)
+            if start_time is not None:
+                self.incident_times.append(time.time() - start_time)
+                self.incidents_completed += 1
+                self.resolution_types[resolution_type] += 1
+    
+    def record_incident_failed(self, incident_code: str):
+        """Descarta una incidencia cuyo procesamiento terminó con error."""
+        with self._lock:
+            self._incidents_in_progress.pop(incident_code, None)
     
     def record_solutions_found(self, count: int):
         """Registra el número de soluciones encontradas."""
-        self.solutions_found_per_incident.append(count)
+        with self._lock:
+            self.solutions_found["incidents"] += 1
+            self.solutions_found["solutions"] += count
+            self.solutions_found["with_solutions" if count > 0 else "without_solutions"] += 1
     
     def record_problem_type(self, problem_type: str):
         """Registra el tipo de problema identificado por el crítico."""
-        if problem_type and problem_type != "unknown":
-            self.problem_types[problem_type] += 1
+        with self._lock:
+            if problem_type and problem_type != "unknown":
+                self.problem_types[problem_type] += 1
     
     def record_critic_decision(self, status: str):
         """Registra la decisión del crítico."""
-        if status == "APPROVED":
-            self.critic_approvals += 1
-        elif status == "REJECTED":
-            self.critic_rejections += 1
+        with self._lock:
+            if status == "APPROVED":
+                self.critic_approvals += 1
+            elif status == "REJECTED":
+                self.critic_rejections += 1
+    
+    def record_relevance_band(self, band: str):
+        """Registra en qué banda de similitud cayó una solución candidata."""
+        with self._lock:
+            self.relevance_bands[band] += 1
+    
+    def record_cache_access(self, cache_name: str, hit: bool):
+        """Registra un acierto o fallo de caché."""
+        with self._lock:
+            self.cache_stats[cache_name]["hits" if hit else "misses"] += 1
+    
+    def record_api_call(self, endpoint: str, seconds: float, ok: bool, retry: bool = False):
+        """Registra la latencia y el resultado de una llamada HTTP a un endpoint."""
+        with self._lock:
+            self.api_latencies[endpoint].append(seconds)
+            stats = self.api_call_stats[endpoint]
+            stats["calls"] += 1
+            stats["errors" if not ok else "ok"] += 1
+            if retry:
+                stats["retries"] += 1
+    
+    def record_stage_time(self, stage: str, seconds: float):
+        """Registra la duración de una etapa del procesamiento de una incidencia."""
+        with self._lock:
+            self.stage_latencies[stage].append(seconds)
+            self.stage_counts[stage] += 1
+    
+    def record_circuit_state(self, dependency: str, state: str):
+        """Registra el estado actual del circuit breaker de una dependencia."""
+        with self._lock:
+            if dependency in self.circuit_states:
+                self.circuit_stats[dependency][f"to_{state}"] += 1
+            self.circuit_states[dependency] = state
+    
+    def record_circuit_rejection(self, dependency: str):
+        """Registra una llamada rechazada por tener el circuito abierto."""
+        with self._lock:
+            self.circuit_stats[dependency]["rejected_calls"] += 1
     
     def record_api_error(self, api_name: str):
         """Registra un error de API."""
-        self.api_errors[api_name] += 1
+        with self._lock:
+            self.api_errors[api_name] += 1
     
     def record_processing_error(self, error: str, incident_code: str = "unknown"):
         """Registra un error de procesamiento."""
-        self.processing_errors.append({
-            "timestamp": datetime.now().isoformat(),
-            "incident_code": incident_code,
-            "error": str(error)
-        })
+        with self._lock:
+            self.processing_error_count += 1
+            self.processing_errors.append({
+                "timestamp": datetime.now().isoformat(),
+                "incident_code": incident_code,
+                "error": str(error)
+            })
     
     def get_summary(self) -> Dict[str, Any]:
         """Obtiene resumen de métricas."""
+        with self._lock:
+            return self._summary()
+    
+    def _summary(self) -> Dict[str, Any]:
         total_time = time.time() - self.start_time
-        total_incidents = len(self.incident_times)
+        total_incidents = self.incidents_completed
         
         summary = {
             "execution_summary": {
@@ -89,14 +166,56 @@ class SystemMetrics:
                 "approval_rate": round(self.critic_approvals / (self.critic_approvals + self.critic_rejections) * 100, 2) if (self.critic_approvals + self.critic_rejections) > 0 else 0
             },
             "solution_effectiveness": {
-                "avg_solutions_per_incident": round(sum(self.solutions_found_per_incident) / len(self.solutions_found_per_incident), 2) if self.solutions_found_per_incident else 0,
-                "incidents_with_solutions": len([x for x in self.solutions_found_per_incident if x > 0]),
-                "incidents_without_solutions": len([x for x in self.solutions_found_per_incident if x == 0])
+                "avg_solutions_per_incident": round(self.solutions_found["solutions"] / self.solutions_found["incidents"], 2) if self.solutions_found["incidents"] else 0,
+                "incidents_with_solutions": self.solutions_found["with_solutions"],
+                "incidents_without_solutions": self.solutions_found["without_solutions"]
+            },
+            "relevance_gating": {
+                "below_floor": self.relevance_bands["below_floor"],
+                "auto_accepted": self.relevance_bands["auto_accepted"],
+                "llm_checked": self.relevance_bands["llm_checked"],
+                "llm_calls_saved": self.relevance_bands["below_floor"] + self.relevance_bands["auto_accepted"]
+            },
+            "cache_performance": {
+                name: {
+                    "hits": stats["hits"],
+                    "misses": stats["misses"],
+                    "hit_rate": round(stats["hits"] / (stats["hits"] + stats["misses"]) * 100, 2) if (stats["hits"] + stats["misses"]) > 0 else 0
+                }
+                for name, stats in self.cache_stats.items()
+            },
+            "api_latency": {
+                endpoint: {
+                    "calls": self.api_call_stats[endpoint]["calls"],
+                    "errors": self.api_call_stats[endpoint]["errors"],
+                    "retries": self.api_call_stats[endpoint]["retries"],
+                    "avg_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+                    "p95_ms": round(sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+                    "max_ms": round(max(latencies) * 1000, 2)
+                }
+                for endpoint, latencies in self.api_latencies.items() if latencies
+            },
+            "stage_latency": {
+                stage: {
+                    "count": self.stage_counts[stage],
+                    "avg_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+                    "p95_ms": round(sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+                    "max_ms": round(max(latencies) * 1000, 2)
+                }
+                for stage, latencies in self.stage_latencies.items() if latencies
+            },
+            "circuit_breakers": {
+                dependency: {
+                    "state": state,
+                    "times_opened": self.circuit_stats[dependency]["to_open"],
+                    "rejected_calls": self.circuit_stats[dependency]["rejected_calls"]
+                }
+                for dependency, state in self.circuit_states.items()
             },
             "error_summary": {
                 "api_errors": dict(self.api_errors),
-                "processing_errors": len(self.processing_errors),
-                "error_rate": round(len(self.processing_errors) / total_incidents * 100, 2) if total_incidents > 0 else 0
+                "processing_errors": self.processing_error_count,
+                "error_rate": round(self.processing_error_count / total_incidents * 100, 2) if total_incidents > 0 else 0
             }
         }
         
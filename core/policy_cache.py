@@ -0,0 +1,103 @@
+"""Caché con TTL y coalescencia de llamadas para las comprobaciones de pólizas en el sistema."""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+from api.sistema import comprobacion_poliza
+from core.metrics import system_metrics
+from config import POLICY_CACHE_TTL_SECONDS, POLICY_CACHE_MAX_ENTRIES, POLICY_CACHE_KEYWORDS
+
+
+class PolicyCache:
+    """
+    Caché LRU con TTL en la que las llamadas concurrentes con la misma clave comparten
+    una única petición al sistema. Los errores no se cachean.
+    """
+
+    def __init__(self, name: str, ttl_seconds: int = POLICY_CACHE_TTL_SECONDS,
+                 max_entries: int = POLICY_CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Devuelve el valor cacheado, espera a la llamada en curso con la misma clave o llama a loader."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                value = entry[1]
+            else:
+                value = None
+                if entry is not None:
+                    del self._entries[key]
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = self._inflight[key] = Future()
+
+        if value is not None:
+            system_metrics.record_cache_access(self.name, True)
+            return copy.deepcopy(value)
+
+        if not owner:
+            # Llamada idéntica en curso: no llega al sistema, cuenta como acierto
+            system_metrics.record_cache_access(self.name, True)
+            return copy.deepcopy(future.result())
+
+        system_metrics.record_cache_access(self.name, False)
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            del self._inflight[key]
+        future.set_result(value)
+        return copy.deepcopy(value)
+
+    def clear(self):
+        """Vacía la caché."""
+        with self._lock:
+            self._entries.clear()
+
+
+def relevant_keywords(keywords: Dict[str, Any]) -> tuple:
+    """Palabras clave que identifican al cliente en la consulta (POLICY_CACHE_KEYWORDS), con los valores enviados."""
+    wanted = {name.lower() for name in POLICY_CACHE_KEYWORDS}
+    relevant = []
+    for name, value in (keywords or {}).items():
+        if str(name).lower() not in wanted:
+            continue
+        values = value if isinstance(value, list) else [value]
+        relevant.append((str(name).lower(), tuple(sorted(str(v) for v in values))))
+    return tuple(sorted(relevant))
+
+
+def cached_comprobacion_poliza(poliza: str, cod_solucion: str, keywords: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    comprobacion_poliza cacheada por (póliza, código de solución, palabras clave relevantes).
+    La clave usa los valores tal como se envían: el sistema distingue mayúsculas en la póliza.
+    """
+    key = (str(poliza), cod_solucion, relevant_keywords(keywords))
+    return policy_check_cache.get_or_load(
+        key,
+        lambda: comprobacion_poliza(poliza=poliza, cod_solucion=cod_solucion, str_json=str(keywords))
+    )
+
+
+# Instancia global de la caché de comprobaciones de pólizas
+policy_check_cache = PolicyCache("comprobacion_poliza")
@@ -0,0 +1,69 @@
+"""Caché de resultados de búsqueda vectorial invalidada por la versión de la colección."""
+
+import copy
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from core.collection_version import get_collection_version
+from core.metrics import system_metrics
+from config import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS
+
+
+def normalize_query(query: str) -> str:
+    """Normaliza el texto de la consulta (minúsculas, sin acentos ni espacios repetidos)."""
+    text = unicodedata.normalize("NFKD", str(query)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(text.lower().split()).strip(" .,;:")
+
+
+class QueryCache:
+    """Caché LRU con TTL de resultados de query_vector_db."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl_seconds: int = QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+
+    def _check_version(self):
+        """Vacía la caché si la colección se ha modificado desde que se llenó."""
+        version = get_collection_version()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, query: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Devuelve el resultado cacheado o None si no existe o ha caducado."""
+        key = (normalize_query(query), limit)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        system_metrics.record_cache_access("query_vector_db", entry is not None)
+        return copy.deepcopy(entry[1]) if entry is not None else None
+
+    def put(self, query: str, limit: int, result: List[Dict[str, Any]]):
+        """Guarda un resultado expulsando la entrada usada hace más tiempo si está llena."""
+        key = (normalize_query(query), limit)
+        with self._lock:
+            self._check_version()
+            self._entries[key] = (time.time(), copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Vacía la caché."""
+        with self._lock:
+            self._entries.clear()
+
+
+# Instancia global de la caché de consultas
+query_cache = QueryCache()
@@ -3,14 +3,28 @@ from observabilidad.logger import resolution_logger
 from api.gestor_incidencias import patch_incidencia
 from api.sistema import comprobacion_poliza
 from core.metrics import system_metrics
+from core.write_behind import write_behind_queue
+from core.policy_cache import cached_comprobacion_poliza
+from config import USE_WRITE_BEHIND, USE_POLICY_CACHE
 
 def safe_patch_incidencia(*args, **kwargs):
     """Wrapper seguro para patch_incidencia con manejo de errores."""
     return patch_incidencia(*args, **kwargs)
 
-def safe_comprobacion_poliza(*args, **kwargs):
-    """Wrapper seguro para comprobacion_poliza con manejo de errores."""
-    return comprobacion_poliza(*args, **kwargs)
+def send_patch_incidencia(estado_api, cod_incidencia, action, **kwargs):
+    """Envía la acción al gestor, o la encola si la cola write-behind está activa, y anota el estado."""
+    if USE_WRITE_BEHIND:
+        estado_api["operacion_gestor"] = write_behind_queue.enqueue(cod_incidencia, action, **kwargs)
+        estado_api["gestor_incidencias"] = "pendiente"
+    else:
+        safe_patch_incidencia(cod_incidencia, action, **kwargs)
+        estado_api["gestor_incidencias"] = "OK"
+
+def safe_comprobacion_poliza(poliza, cod_solucion, keywords):
+    """Wrapper para comprobacion_poliza, cacheada si USE_POLICY_CACHE está activo."""
+    if USE_POLICY_CACHE:
+        return cached_comprobacion_poliza(poliza, cod_solucion, keywords)
+    return comprobacion_poliza(poliza=poliza, cod_solucion=cod_solucion, str_json=str(keywords))
 
 def process_resolution(resolution, incidencia, keywords):
     """Procesa la resolución según su tipo y ejecuta las acciones correspondientes."""
@@ -33,8 +47,8 @@ def process_resolution(resolution, incidencia, keywords):
     # Add label to solution
     solucion = f"{etiqueta}{solucion}"
     
-    # Initialize API status
-    estado_api = {"gestor_incidencias": "", "sistema": ""}
+    # Initialize API status (keeping the system call status of api|xxx resolutions)
+    estado_api = {"gestor_incidencias": "", "sistema": "", **resolution.get("metadata", {}).get("estado_api", {})}
     
     resolution_logger.info(f"Procesando resolución tipo: {resolution_type}", extra_data={
         "action": "process_resolution",
@@ -53,8 +67,7 @@ def process_resolution(resolution, incidencia, keywords):
     
     elif resolution_type == "cierre":
         try:
-            safe_patch_incidencia(incidencia["codIncidencia"], "resolver", notas_resolucion=solucion)
-            estado_api["gestor_incidencias"] = "OK"
+            send_patch_incidencia(estado_api, incidencia["codIncidencia"], "resolver", notas_resolucion=solucion)
             resolution_logger.info("Incidencia cerrada exitosamente", extra_data={
                 "action": "incident_closed_success",
                 "codIncidencia": incidencia["codIncidencia"]
@@ -75,8 +88,7 @@ def process_resolution(resolution, incidencia, keywords):
     
     elif resolution_type == "en espera":
         try:
-            safe_patch_incidencia(incidencia["codIncidencia"], "en_espera", detalle=solucion)
-            estado_api["gestor_incidencias"] = "OK"
+            send_patch_incidencia(estado_api, incidencia["codIncidencia"], "en_espera", detalle=solucion)
             resolution_logger.info("Incidencia puesta en espera exitosamente", extra_data={
                 "action": "incident_wait_success",
                 "codIncidencia": incidencia["codIncidencia"]
@@ -96,8 +108,7 @@ def process_resolution(resolution, incidencia, keywords):
     
     elif resolution_type == "reasignacion":
         try:
-            safe_patch_incidencia(incidencia["codIncidencia"], "reasignar", buzon_destino=buzon_reasignacion, detalle=solucion)
-            estado_api["gestor_incidencias"] = "OK"
+            send_patch_incidencia(estado_api, incidencia["codIncidencia"], "reasignar", buzon_destino=buzon_reasignacion, detalle=solucion)
             resolution_logger.info("Incidencia reasignada exitosamente", extra_data={
                 "action": "incident_reassigned_success",
                 "codIncidencia": incidencia["codIncidencia"],
@@ -140,7 +151,7 @@ def process_resolution(resolution, incidencia, keywords):
         
         # Call policy check API
         try:
-            response = safe_comprobacion_poliza(poliza=poliza, cod_solucion=cod_solucion, str_json=str(keywords))
+            response = safe_comprobacion_poliza(poliza, cod_solucion, keywords)
             estado_api["sistema"] = "ok"
             resolution_logger.info("Llamada al sistema exitosa", extra_data={
                 "action": "system_api_success",
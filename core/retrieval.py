@@ -0,0 +1,112 @@
+"""Fusión de resultados de la base de datos vectorial: entre versiones y búsqueda híbrida."""
+
+from collections import namedtuple
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from config import FUSION_METHOD, FUSION_RRF_K, FUSION_TOP_K, HYBRID_DENSE_WEIGHT, HYBRID_LEXICAL_WEIGHT
+
+# Mismos atributos que los resultados de client.search (id, score, payload, vector) más el score
+# léxico normalizado de la búsqueda híbrida (None si el resultado no viene de ella)
+SearchHit = namedtuple("SearchHit", ["id", "score", "payload", "vector", "lexical"], defaults=(None, None))
+
+
+def _hit_key(hit: Dict[str, Any]) -> str:
+    """Clave de deduplicación de un resultado: id del punto o, en su defecto, su metadata."""
+    if hit.get("id") is not None:
+        return str(hit["id"])
+    return str(hit.get("metadata", {}))
+
+
+def fuse_results(results_per_version: List[Tuple[str, List[Dict[str, Any]]]],
+                 method: str = FUSION_METHOD,
+                 top_k: int = FUSION_TOP_K,
+                 rrf_k: int = FUSION_RRF_K) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Fusiona los resultados de varias versiones de la consulta por id de punto.
+
+    Con "rrf" puntúa cada resultado con reciprocal rank fusion (suma de 1 / (rrf_k + rank)),
+    con "max" usa el mejor score de similitud. Devuelve el top-K deduplicado como pares
+    (versión que obtuvo el mejor score, resultado), ordenados por score de fusión. El resultado
+    lleva como lexical_score el mejor score léxico del punto entre todas las versiones.
+    """
+    fused = {}
+
+    for version, hits in results_per_version:
+        for rank, hit in enumerate(hits, 1):
+            key = _hit_key(hit)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {"version": version, "hit": hit, "rrf": 0.0, "lexical": None}
+            elif hit["score"] > entry["hit"]["score"]:
+                entry["version"] = version
+                entry["hit"] = hit
+            entry["rrf"] += 1.0 / (rrf_k + rank)
+            if hit.get("lexical_score") is not None:
+                entry["lexical"] = max(entry["lexical"] or 0.0, hit["lexical_score"])
+
+    if method == "max":
+        ranked = sorted(fused.values(), key=lambda e: e["hit"]["score"], reverse=True)
+    else:
+        ranked = sorted(fused.values(), key=lambda e: (e["rrf"], e["hit"]["score"]), reverse=True)
+
+    # Copia del resultado si hay que cambiar su score léxico (los resultados pueden venir de la caché)
+    return [
+        (entry["version"], entry["hit"] if entry["hit"].get("lexical_score") == entry["lexical"]
+         else {**entry["hit"], "lexical_score": entry["lexical"]})
+        for entry in ranked[:top_k]
+    ]
+
+
+def _dense_vector(hit) -> Any:
+    """Vector denso de un resultado (los puntos híbridos devuelven un dict de vectores)."""
+    vector = getattr(hit, "vector", None)
+    if isinstance(vector, dict):
+        return vector.get("")
+    return vector
+
+
+def _cosine(query: np.ndarray, vector: Any) -> float:
+    """Similitud coseno entre la consulta normalizada y un vector."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return float(query @ vector / norm) if norm > 0 else 0.0
+
+
+def combine_hybrid_results(query_vector: List[float], dense_hits: List[Any], lexical_hits: List[Any], limit: int,
+                           dense_weight: float = HYBRID_DENSE_WEIGHT,
+                           lexical_weight: float = HYBRID_LEXICAL_WEIGHT) -> List[SearchHit]:
+    """
+    Combina resultados densos y léxicos con pesos configurables.
+
+    El score léxico se normaliza por el máximo de la consulta y se pondera con el coseno.
+    Los resultados devueltos conservan como score la similitud coseno, de modo que los
+    umbrales existentes siguen teniendo el mismo significado, y llevan en lexical el score
+    léxico normalizado (0-1) para no descartar coincidencias exactas con coseno bajo.
+    """
+    query = np.asarray(query_vector, dtype=np.float32)
+    query_norm = np.linalg.norm(query)
+    if query_norm > 0:
+        query = query / query_norm
+
+    candidates = {}
+    for hit in dense_hits:
+        candidates[str(hit.id)] = {"hit": hit, "cosine": float(hit.score), "lexical": 0.0}
+
+    max_lexical = max((hit.score for hit in lexical_hits), default=0.0)
+    for hit in lexical_hits:
+        lexical = hit.score / max_lexical if max_lexical > 0 else 0.0
+        entry = candidates.get(str(hit.id))
+        if entry is not None:
+            entry["lexical"] = lexical
+            continue
+        vector = _dense_vector(hit)
+        if vector is None:
+            continue
+        candidates[str(hit.id)] = {"hit": hit, "cosine": _cosine(query, vector), "lexical": lexical}
+
+    ranked = sorted(
+        candidates.values(),
+        key=lambda e: dense_weight * e["cosine"] + lexical_weight * e["lexical"],
+        reverse=True
+    )
+    return [SearchHit(str(e["hit"].id), e["cosine"], e["hit"].payload, lexical=e["lexical"]) for e in ranked[:limit]]
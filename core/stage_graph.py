@@ -0,0 +1,59 @@
+"""Ejecución de las etapas de una incidencia como grafo de dependencias."""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Callable, Dict, Sequence, Tuple
+from core.metrics import system_metrics
+
+# Etapa: función y nombres de las etapas de las que depende (sus resultados son los argumentos)
+Stage = Tuple[Callable[..., Any], Sequence[str]]
+
+
+def run_stage_graph(stages: Dict[str, Stage], executor: Executor) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Ejecuta las etapas en cuanto sus dependencias terminan, en paralelo las que son independientes.
+
+    Devuelve los resultados y la duración en segundos de cada etapa. Si una etapa falla no se lanzan
+    más y se propaga su excepción cuando terminan las que estaban en curso.
+    """
+    unknown = {dep for _, deps in stages.values() for dep in deps} - set(stages)
+    if unknown:
+        raise ValueError(f"Dependencias sin etapa: {sorted(unknown)}")
+
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+    pending = dict(stages)
+    running = {}
+
+    def timed(name, fn, args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = time.perf_counter() - start
+            system_metrics.record_stage_time(name, timings[name])
+
+    error = None
+    while pending or running:
+        if error is None:
+            for name, (fn, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    del pending[name]
+                    running[executor.submit(timed, name, fn, [results[dep] for dep in deps])] = name
+        if not running:
+            if error is None:
+                raise ValueError(f"Dependencias circulares entre las etapas: {sorted(pending)}")
+            break
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                if error is None:
+                    error = e
+
+    if error is not None:
+        raise error
+    return results, timings
@@ -0,0 +1,259 @@
+"""Cola write-behind de acciones sobre el gestor de incidencias."""
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from api.gestor_incidencias import patch_incidencias_bulk
+from api.http_client import backoff_delay
+from observabilidad.logger import resolution_logger
+from config import (WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_SECONDS, WRITE_BEHIND_MAX_ATTEMPTS,
+                    WRITE_BEHIND_JOURNAL_FILE, WRITE_BEHIND_MAX_RESULTS)
+
+# Nombres de campo que espera el gestor para cada parámetro de patch_incidencia
+FIELD_NAMES = {
+    "buzon_destino": "buzonDestino",
+    "notas_resolucion": "notasResolucion",
+    "detalle": "detalle"
+}
+
+
+class WriteBehindQueue:
+    """
+    Acumula las acciones sobre incidencias y las envía en lote desde un hilo en segundo plano.
+
+    Cada acción se anota en un journal local antes de encolarla y su resultado al confirmarse,
+    de modo que las que no llegaron a confirmarse se reenvían en la siguiente ejecución. Los
+    resultados se olvidan al leerlos y solo se conservan los max_results más recientes sin leer.
+    """
+
+    def __init__(self, journal_file: str = WRITE_BEHIND_JOURNAL_FILE, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_seconds: float = WRITE_BEHIND_FLUSH_SECONDS, max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS,
+                 max_results: int = WRITE_BEHIND_MAX_RESULTS):
+        self.journal_file = journal_file
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_attempts = max_attempts
+        self.max_results = max_results
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._outstanding = set()
+        self._results: "OrderedDict[str, str]" = OrderedDict()
+        self._worker = None
+        self._recovered = False
+
+    def _append_journal(self, entry: Dict[str, Any]):
+        """Añade una entrada al journal y la fuerza a disco."""
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _recover(self):
+        """Reencola las acciones del journal que no se confirmaron en ejecuciones anteriores."""
+        if not os.path.exists(self.journal_file):
+            return
+        operations, confirmed = {}, set()
+        with open(self.journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["evento"] == "encolada":
+                    operations[entry["operacion"]["idOperacion"]] = entry["operacion"]
+                elif entry["evento"] == "resultado":
+                    confirmed.add(entry["idOperacion"])
+
+        for op_id, operation in operations.items():
+            if op_id not in confirmed:
+                self._pending[op_id] = operation
+                self._outstanding.add(op_id)
+                self._queue.put(op_id)
+
+        if self._pending:
+            resolution_logger.info(f"Reanudando {len(self._pending)} acciones pendientes del journal", extra_data={
+                "action": "write_behind_recovered",
+                "pending_operations": len(self._pending)
+            })
+
+    def _set_result(self, op_id: str, estado: str):
+        """Anota el resultado de una acción descartando los más antiguos sin leer (llamar con el lock)."""
+        self._results[op_id] = estado
+        self._results.move_to_end(op_id)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    def _ensure_started(self):
+        """Recupera el journal y arranca el hilo de envío en el primer uso."""
+        with self._lock:
+            if not self._recovered:
+                self._recovered = True
+                self._recover()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._worker.start()
+
+    def enqueue(self, cod_incidencia: str, action: str, **kwargs) -> str:
+        """Encola una acción (mismos parámetros que patch_incidencia) y devuelve su id de operación."""
+        self._ensure_started()
+        op_id = uuid.uuid4().hex
+        operation = {"idOperacion": op_id, "codIncidencia": cod_incidencia, "action": action}
+        for name, value in kwargs.items():
+            if value:
+                operation[FIELD_NAMES.get(name, name)] = value
+
+        with self._lock:
+            self._append_journal({"evento": "encolada", "operacion": operation, "fecha": datetime.now().isoformat()})
+            self._pending[op_id] = operation
+            self._outstanding.add(op_id)
+        self._queue.put(op_id)
+        return op_id
+
+    def _next_batch(self) -> List[str]:
+        """Espera la primera acción y completa el lote hasta batch_size acciones o flush_seconds."""
+        try:
+            batch = [self._queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._send(batch)
+
+    def _send(self, op_ids: List[str]):
+        """Envía un lote con reintentos; si se agotan, las acciones quedan pendientes en el journal."""
+        with self._lock:
+            operations = [self._pending[op_id] for op_id in op_ids]
+
+        results, last_error = None, None
+        for attempt in range(self.max_attempts):
+            try:
+                results = patch_incidencias_bulk(operations)
+                break
+            except Exception as e:
+                last_error = e
+                resolution_logger.warning("Error enviando lote de acciones al gestor", extra_data={
+                    "action": "write_behind_send_error",
+                    "operations": len(operations),
+                    "attempt": attempt + 1,
+                    "error": str(e)
+                })
+                if attempt < self.max_attempts - 1:
+                    time.sleep(backoff_delay(attempt))
+
+        with self._lock:
+            if results is None:
+                # Sin resultado en el journal: se reenvían en la siguiente ejecución
+                for op_id in op_ids:
+                    self._set_result(op_id, f"pendiente: {last_error}")
+                    self._outstanding.discard(op_id)
+            else:
+                by_id = {result.get("idOperacion"): result for result in results}
+                for op_id in op_ids:
+                    result = by_id.get(op_id)
+                    if result is not None and result.get("ok"):
+                        estado = "OK"
+                    else:
+                        estado = f"error: {result.get('error') if result else 'sin respuesta del gestor'}"
+                    self._append_journal({
+                        "evento": "resultado",
+                        "idOperacion": op_id,
+                        "estado": estado,
+                        "fecha": datetime.now().isoformat()
+                    })
+                    self._set_result(op_id, estado)
+                    self._pending.pop(op_id, None)
+                    self._outstanding.discard(op_id)
+
+                resolution_logger.info(f"Lote de {len(op_ids)} acciones enviado al gestor", extra_data={
+                    "action": "write_behind_batch_sent",
+                    "operations": len(op_ids),
+                    "errors": sum(1 for op_id in op_ids if self._results.get(op_id) != "OK")
+                })
+            self._idle.notify_all()
+
+    def requeue_pending(self) -> int:
+        """Vuelve a encolar las acciones que agotaron sus reintentos (para procesos de larga duración)."""
+        with self._lock:
+            op_ids = [op_id for op_id in self._pending if op_id not in self._outstanding]
+            for op_id in op_ids:
+                self._outstanding.add(op_id)
+                self._results.pop(op_id, None)
+        if not op_ids:
+            return 0
+        self._ensure_started()
+        for op_id in op_ids:
+            self._queue.put(op_id)
+        resolution_logger.info(f"Reencoladas {len(op_ids)} acciones pendientes", extra_data={
+            "action": "write_behind_requeued",
+            "pending_operations": len(op_ids)
+        })
+        return len(op_ids)
+    
+    def discard(self, op_id: str) -> bool:
+        """
+        Retira sin enviarla una acción que agotó sus reintentos (p. ej. porque la incidencia se va a
+        volver a procesar). Devuelve False si la acción ya se confirmó o sigue en envío.
+        """
+        with self._lock:
+            if op_id not in self._pending or op_id in self._outstanding:
+                return False
+            self._append_journal({
+                "evento": "resultado",
+                "idOperacion": op_id,
+                "estado": "descartada",
+                "fecha": datetime.now().isoformat()
+            })
+            del self._pending[op_id]
+            self._results.pop(op_id, None)
+        return True
+    
+    def _compact_journal(self):
+        """Reescribe el journal dejando solo las acciones sin confirmar."""
+        tmp_path = f"{self.journal_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for operation in self._pending.values():
+                f.write(json.dumps({"evento": "encolada", "operacion": operation}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.journal_file)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se envíen todas las acciones encoladas (y las pendientes del journal); False si vence el timeout."""
+        if self._worker is None and not os.path.exists(self.journal_file):
+            return True
+        self._ensure_started()
+        with self._idle:
+            done = self._idle.wait_for(lambda: not self._outstanding, timeout)
+            if done:
+                self._compact_journal()
+            return done
+
+    def pop_result(self, op_id: str) -> Optional[str]:
+        """
+        Estado de una acción: "OK", "error: ...", "pendiente: ..." o None si aún no se ha enviado.
+        El resultado se olvida al leerlo (en un proceso de larga duración el mapa no crece sin límite).
+        """
+        with self._lock:
+            return self._results.pop(op_id, None)
+
+
+# Instancia global de la cola write-behind
+write_behind_queue = WriteBehindQueue()
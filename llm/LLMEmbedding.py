@@ -4,23 +4,45 @@ from typing import List
 from langchain_ollama import OllamaEmbeddings
 from langchain_community.embeddings import OpenAIEmbeddings
 from .LLMLogger import log_llm_interaction
+from core.circuit_breaker import get_breaker
 from config import ENTORNO, OLLAMA_BASE_URL, OPENAI_API_KEY, LLM_MODEL_EMBEDDING_DESA, LLM_MODEL_EMBEDDING_PROD
 
-def get_embedding(text: str) -> List[float]:
-    """Obtiene el embedding de un texto."""
+
+# Circuit breaker del backend LLM (embeddings incluidos)
+llm_breaker = get_breaker("llm")
+
+def get_embedding_model():
+    """Obtiene el modelo de embeddings apropiado según el entorno."""
     if ENTORNO == "DESA":
-        embedding_model = OllamaEmbeddings(
+        return OllamaEmbeddings(
             base_url=OLLAMA_BASE_URL,
             model=LLM_MODEL_EMBEDDING_DESA,
         )
     else:
-        embedding_model = OpenAIEmbeddings(
+        return OpenAIEmbeddings(
             model=LLM_MODEL_EMBEDDING_PROD,
             openai_api_key=OPENAI_API_KEY
         )
+
+def get_embedding(text: str) -> List[float]:
+    """Obtiene el embedding de un texto."""
+    embedding_model = get_embedding_model()
     
-    embedding = embedding_model.embed_query(text)
+    embedding = llm_breaker.call(embedding_model.embed_query, text)
     
     log_llm_interaction("LLMEmbedding", f"text: {text[:100]}...", f"embedding length: {len(embedding)}")
     
-    return embedding 
\ No newline at end of file
+    return embedding
+
+def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """Obtiene los embeddings de varios textos en una sola petición."""
+    if not texts:
+        return []
+    
+    embedding_model = get_embedding_model()
+    
+    embeddings = llm_breaker.call(embedding_model.embed_documents, texts)
+    
+    log_llm_interaction("LLMEmbedding", f"texts: {len(texts)}", f"embeddings: {len(embeddings)}")
+    
+    return embeddings
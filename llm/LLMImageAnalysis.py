@@ -1,4 +1,5 @@
-import os
+import io
+import threading
 import requests
 import mlflow
 import mlflow.pytorch
@@ -20,6 +21,9 @@ except Exception as e:
     print(f"Error cargando modelo fine-tuneado: {e}")
     global_model = None
 
+# La inferencia con el modelo no es segura entre hilos: una imagen a la vez
+model_lock = threading.Lock()
+
 def analyze_image_with_fine_tuned_model(image_url: str, model) -> str:
     """
     Analiza una imagen usando el modelo fine-tuneado.
@@ -36,13 +40,8 @@ def analyze_image_with_fine_tuned_model(image_url: str, model) -> str:
         response = requests.get(image_url)
         response.raise_for_status()
         
-        # Guardar imagen temporalmente
-        temp_path = "temp_image.png"
-        with open(temp_path, "wb") as f:
-            f.write(response.content)
-        
-        # Cargar y procesar imagen
-        image = Image.open(temp_path).convert("RGB")
+        # Cargar y procesar imagen en memoria (sin fichero temporal compartido entre hilos)
+        image = Image.open(io.BytesIO(response.content)).convert("RGB")
         
         # Cargar tokenizer
         tokenizer = AutoTokenizer.from_pretrained('./finetune/LLMImage/results/tokenizer_base')
@@ -57,7 +56,7 @@ def analyze_image_with_fine_tuned_model(image_url: str, model) -> str:
         pixel_values = feature_extractor(image, return_tensors="pt").pixel_values
         
         # Generar descripción
-        with torch.no_grad():
+        with model_lock, torch.no_grad():
             generated_ids = model.generate(
                 pixel_values,
                 max_length=128,
@@ -68,9 +67,6 @@ def analyze_image_with_fine_tuned_model(image_url: str, model) -> str:
         # Decodificar resultado
         generated_text = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
         
-        # Limpiar archivo temporal
-        os.remove(temp_path)
-        
         return generated_text
         
     except Exception as e:
@@ -1,7 +1,11 @@
 import csv
 import os
+import threading
 from datetime import datetime
 
+# Serializa las escrituras cuando varios hilos registran interacciones a la vez
+_write_lock = threading.Lock()
+
 
 def log_llm_interaction(llm_name: str, input_data, output_data):
     """
@@ -22,16 +26,17 @@ def log_llm_interaction(llm_name: str, input_data, output_data):
         timestamp = datetime.now().isoformat()
         
         # Escribir al archivo
-        file_exists = os.path.exists(log_file)
-        with open(log_file, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            
-            # Header solo si es nuevo
-            if not file_exists:
-                writer.writerow(["timestamp", "input", "output"])
-            
-            # Escribir datos
-            writer.writerow([timestamp, input_str, output_str])
+        with _write_lock:
+            file_exists = os.path.exists(log_file)
+            with open(log_file, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                
+                # Header solo si es nuevo
+                if not file_exists:
+                    writer.writerow(["timestamp", "input", "output"])
+                
+                # Escribir datos
+                writer.writerow([timestamp, input_str, output_str])
             
     except Exception:
         # Silencioso - no debe romper el flujo principal
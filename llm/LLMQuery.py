@@ -2,33 +2,133 @@
 
 from typing import List, Dict, Any
 from qdrant_client import QdrantClient
+from qdrant_client.http import models
 from .LLMEmbedding import get_embedding
 from .LLMLogger import log_llm_interaction
-from config import VECTOR_DB_URL, QUERY_LIMIT_VECTORDB
+from core.local_index import local_index
+from core.lexical import query_sparse_vector
+from core.retrieval import combine_hybrid_results
+from core.query_cache import query_cache
+from core.circuit_breaker import get_breaker, is_dependency_failure
+from core.collection_version import get_collection_version
+from observabilidad.logger import main_logger
+from config import (VECTOR_DB_URL, QUERY_LIMIT_VECTORDB, USE_LOCAL_INDEX, USE_HYBRID_SEARCH,
+                    HYBRID_CANDIDATES_FACTOR, LEXICAL_VECTOR_NAME, USE_QUERY_CACHE,
+                    VECTOR_QUANTIZATION, QUANTIZATION_RESCORE, QUANTIZATION_OVERSAMPLING)
+
+# Campos del payload de uso interno que no forman parte de la metadata de la solución
+INTERNAL_PAYLOAD_KEYS = {"summary", "content_hash", "source_file"}
+
+# Versiones de la colección que rechazan la búsqueda léxica (creadas sin vectores dispersos):
+# no se vuelve a intentar hasta que la colección cambie de versión
+lexical_unsupported_versions = set()
 
 def get_qdrant_client():
     """Obtiene cliente de Qdrant."""
     return QdrantClient(url=VECTOR_DB_URL)
 
-def query_vector_db(query: str, limit: int = QUERY_LIMIT_VECTORDB) -> List[Dict[str, Any]]:
-    """Consulta la base de datos vectorial por incidencias similares."""
+def get_search_params():
+    """Parámetros de búsqueda: rescoring con vectores originales si la colección está cuantizada."""
+    if VECTOR_QUANTIZATION == "none":
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(
+            rescore=QUANTIZATION_RESCORE,
+            oversampling=QUANTIZATION_OVERSAMPLING
+        )
+    )
+
+def search_dense(query_vector: List[float], limit: int) -> List[Any]:
+    """Búsqueda densa por coseno (réplica local si está activa, si no Qdrant)."""
+    if USE_LOCAL_INDEX:
+        try:
+            return local_index.search(query_vector, limit)
+        except Exception as e:
+            main_logger.warning("Índice local no disponible, consultando Qdrant", extra_data={
+                "action": "local_index_search_error",
+                "error": str(e)
+            })
+
     client = get_qdrant_client()
-    query_vector = get_embedding(query)
-    
-    search_result = client.search(
+    return get_breaker("qdrant").call(
+        client.search,
         collection_name="incidencias",
         query_vector=query_vector,
-        limit=limit
+        limit=limit,
+        search_params=get_search_params()
     )
-    
+
+def search_lexical(query: str, limit: int) -> List[Any]:
+    """Búsqueda léxica BM25 sobre los vectores dispersos del catálogo."""
+    indices, values = query_sparse_vector(query)
+    if not indices:
+        return []
+
+    if USE_LOCAL_INDEX:
+        try:
+            return local_index.search_lexical(indices, limit)
+        except Exception as e:
+            main_logger.warning("Índice local no disponible para búsqueda léxica, consultando Qdrant", extra_data={
+                "action": "local_index_lexical_error",
+                "error": str(e)
+            })
+
+    client = get_qdrant_client()
+    return get_breaker("qdrant").call(
+        client.search,
+        collection_name="incidencias",
+        query_vector=models.NamedSparseVector(
+            name=LEXICAL_VECTOR_NAME,
+            vector=models.SparseVector(indices=indices, values=values)
+        ),
+        limit=limit,
+        with_vectors=True
+    )
+
+def query_vector_db(query: str, limit: int = QUERY_LIMIT_VECTORDB) -> List[Dict[str, Any]]:
+    """Consulta la base de datos vectorial por incidencias similares."""
+    if USE_QUERY_CACHE:
+        cached = query_cache.get(query, limit)
+        if cached is not None:
+            log_llm_interaction("LLMQuery", f"query: {query}, limit: {limit}", f"results: {len(cached)} (cache)")
+            return cached
+
+    query_vector = get_embedding(query)
+
+    if USE_HYBRID_SEARCH:
+        candidates_limit = limit * HYBRID_CANDIDATES_FACTOR
+        dense_hits = search_dense(query_vector, candidates_limit)
+        version = get_collection_version()
+        lexical_hits = []
+        if version not in lexical_unsupported_versions:
+            try:
+                lexical_hits = search_lexical(query, candidates_limit)
+            except Exception as e:
+                if not is_dependency_failure(e):
+                    # Colección creada sin vectores dispersos: solo búsqueda densa para esta versión
+                    lexical_unsupported_versions.add(version)
+                main_logger.warning("Búsqueda léxica no disponible, usando solo búsqueda densa", extra_data={
+                    "action": "lexical_search_error",
+                    "collection_version": version,
+                    "error": str(e)
+                })
+        search_result = combine_hybrid_results(query_vector, dense_hits, lexical_hits, limit)
+    else:
+        search_result = search_dense(query_vector, limit)
+
     result = [
         {
+            "id": str(hit.id),
             "score": hit.score,
-            "metadata": {k: v for k, v in hit.payload.items() if k != "summary"},
+            "lexical_score": getattr(hit, "lexical", None),
+            "metadata": {k: v for k, v in hit.payload.items() if k not in INTERNAL_PAYLOAD_KEYS},
             "summary": hit.payload.get("summary", "")
         }
         for hit in search_result
     ]
-    
+
+    if USE_QUERY_CACHE:
+        query_cache.put(query, limit, result)
+
     log_llm_interaction("LLMQuery", f"query: {query}, limit: {limit}", f"results: {len(result)}")
-    return result 
\ No newline at end of file
+    return result
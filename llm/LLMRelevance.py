@@ -5,8 +5,13 @@ from langchain_ollama import OllamaLLM
 from langchain_community.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from .LLMLogger import log_llm_interaction
+from core.circuit_breaker import get_breaker
 from config import ENTORNO, OLLAMA_BASE_URL, OPENAI_API_KEY, LLM_MODEL_DESA, LLM_MODEL_PROD, LLM_TEMPERATURE
 
+
+# Circuit breaker del backend LLM
+llm_breaker = get_breaker("llm")
+
 def get_llm():
     """Obtiene el LLM apropiado según el entorno."""
     if ENTORNO == "DESA":
@@ -38,7 +43,7 @@ def check_relevance(incident: Dict[str, Any], solution: Dict[str, Any]) -> str:
     
     chain = prompt | llm
     
-    response = chain.invoke({
+    response = llm_breaker.call(chain.invoke, {
         "incident": str(incident),
         "solution": str(solution)
     })
@@ -1,28 +1,58 @@
+import argparse
+import hashlib
 import json
+import os
+import signal
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any
-from api.gestor_incidencias import get_incidencias
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from api.gestor_incidencias import iter_incidencias
 from llm.LLMRephrase import rephrase_incidence
 from llm.LLMRelevance import check_relevance
 from llm.LLMQuery import query_vector_db
 from llm.LLMKeywords import extract_keywords
 from llm.LLMImageAnalysis import process_attachments
 from core.critico import process_resolution_with_critic
+from core.retrieval import fuse_results
 from core.resolution import process_resolution
 from observabilidad.logger import main_logger
 from core.utils import convert_json_response
 from collections import Counter
 from core.metrics import system_metrics
+from core.write_behind import write_behind_queue
+from core.circuit_breaker import CircuitOpenError
+from core.stage_graph import run_stage_graph
+from config import (RELEVANCE_SCORE_FLOOR, RELEVANCE_SCORE_CEILING, RELEVANCE_LEXICAL_EXEMPT, USE_WRITE_BEHIND, WRITE_BEHIND_FLUSH_TIMEOUT,
+                    INCIDENT_WORKERS, STAGE_PARALLELISM, DAEMON_POLL_SECONDS, DAEMON_STATE_FILE,
+                    GESTOR_SYSTEM_AUTHOR)
 
-def get_relevant_solutions(incident: str) -> List[Dict[str, Any]]:
-    """Obtiene soluciones relevantes de la base de datos vectorial."""
+# Hilos compartidos por las etapas de todas las incidencias en curso
+stage_executor = ThreadPoolExecutor(max_workers=INCIDENT_WORKERS * STAGE_PARALLELISM, thread_name_prefix="stage")
+
+def get_relevant_solutions(candidates: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Filtra las soluciones candidatas (versión, solución) por bandas de similitud.
     
-    similar_incidents = query_vector_db(incident)
-    main_logger.info(f"Encontrados {len(similar_incidents)} incidentes similares")
+    Por debajo de RELEVANCE_SCORE_FLOOR se descartan y por encima de RELEVANCE_SCORE_CEILING
+    se aceptan sin llamar al LLM; solo la banda intermedia pasa por check_relevance. Las
+    coincidencias léxicas fuertes (lexical_score >= RELEVANCE_LEXICAL_EXEMPT) no se descartan
+    por el mínimo: pasan por check_relevance aunque su similitud coseno sea baja.
+    """
     
     relevant_solutions = []
-    for solution in similar_incidents:
+    for incident, solution in candidates:
+        score = solution.get("score", 0)
+        if score < RELEVANCE_SCORE_FLOOR and (solution.get("lexical_score") or 0) < RELEVANCE_LEXICAL_EXEMPT:
+            system_metrics.record_relevance_band("below_floor")
+            continue
+        if score >= RELEVANCE_SCORE_CEILING:
+            system_metrics.record_relevance_band("auto_accepted")
+            relevant_solutions.append(solution)
+            continue
+        
+        system_metrics.record_relevance_band("llm_checked")
         relevance_response = check_relevance(incident, solution)
         if relevance_response.lower().strip().find("true") >= 0:
             relevant_solutions.append(solution)
@@ -64,69 +94,76 @@ def process_incident_attachments(incidencia: Dict[str, Any]) -> Dict[str, Any]:
     return enhanced_incidencia
 
 
-def collect_relevant_solutions(rephrased_versions: List[str]) -> List[Dict[str, Any]]:
-    """Recolecta todas las soluciones relevantes para las versiones reformuladas."""
-    all_relevant_solutions = []
+def search_versions(versions: List[str]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """Consulta la base de datos vectorial con cada versión y devuelve (versión, resultados) por versión."""
+    results_per_version = []
     
-    for k, version in enumerate(rephrased_versions):
-        main_logger.info(f"Procesando versión {k+1}/{len(rephrased_versions)}")
+    for k, version in enumerate(versions):
+        main_logger.info(f"Procesando versión {k+1}/{len(versions)}")
         
         # Debug significativo: preview de la versión que se está procesando
         main_logger.debug(f"Procesando versión reformulada {k+1}", extra_data={
             "action": "process_version",
             "version_index": k + 1,
-            "total_versions": len(rephrased_versions),
+            "total_versions": len(versions),
             "version_preview": version[:100] + "..." if len(version) > 100 else version
         })
         
-        relevant_solutions = get_relevant_solutions(version)
-        all_relevant_solutions.extend(relevant_solutions)
+        similar_incidents = query_vector_db(version)
+        results_per_version.append((version, similar_incidents))
         
-        # Debug significativo: cuántas soluciones se encontraron por versión
-        main_logger.debug(f"Soluciones encontradas para versión {k+1}: {len(relevant_solutions)}", extra_data={
+        # Debug significativo: cuántos incidentes similares se encontraron por versión
+        main_logger.debug(f"Incidentes similares para versión {k+1}: {len(similar_incidents)}", extra_data={
             "action": "version_solutions_found",
             "version_index": k + 1,
-            "solutions_count": len(relevant_solutions)
+            "solutions_count": len(similar_incidents)
         })
     
-    # Debug significativo: resumen total de soluciones
-    unique_solutions = len(set(str(s) for s in all_relevant_solutions))
-    main_logger.debug(f"Recolección de soluciones completada", extra_data={
+    return results_per_version
+
+def collect_relevant_solutions(results_per_version: List[Tuple[str, List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """Recolecta las soluciones relevantes fusionando los resultados de todas las versiones reformuladas."""
+    # Fusionar resultados por id de punto antes de las comprobaciones de relevancia
+    candidates = fuse_results(results_per_version)
+    total_hits = sum(len(hits) for _, hits in results_per_version)
+    unique_hits = len({str(hit.get("id")) for _, hits in results_per_version for hit in hits})
+    
+    # Debug significativo: resumen de la fusión
+    main_logger.debug(f"Fusión de resultados completada", extra_data={
         "action": "all_solutions_collected",
-        "total_solutions": len(all_relevant_solutions),
-        "unique_solutions": unique_solutions,
-        "duplicate_solutions": len(all_relevant_solutions) - unique_solutions
+        "total_solutions": total_hits,
+        "unique_solutions": unique_hits,
+        "duplicate_solutions": total_hits - unique_hits,
+        "forwarded_solutions": len(candidates)
     })
     
+    all_relevant_solutions = get_relevant_solutions(candidates)
+    
     main_logger.info(f"Total de soluciones relevantes encontradas: {len(all_relevant_solutions)}")
     return all_relevant_solutions
 
-def main():
-    """Función principal del sistema."""
-    start_time = time.time()
+def needs_retry(estado_api: Dict[str, Any]) -> bool:
+    """Indica si falló la acción sobre el gestor o la consulta al sistema (la incidencia debe reintentarse)."""
+    return any(
+        str(estado_api.get(api, "")).startswith(("error", "pendiente:"))
+        for api in ("gestor_incidencias", "sistema")
+    )
+
+def process_incident(i: int, incidencia: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], str, bool]]:
+    """
+    Procesa una incidencia de principio a fin.
     
-    # Obtener incidencias abiertas
-    main_logger.info("Obteniendo incidencias abiertas...")
-    incidencias = get_incidencias()
-    total_incidencias = len(incidencias)
-    main_logger.info(f"Total de incidencias a procesar: {total_incidencias}")
+    Devuelve la entrada del reporte, el tipo de resolución y si hay que reintentarla (circuito
+    abierto o error del gestor o del sistema), o None si el procesamiento falla.
+    No toca estado compartido salvo las métricas, por lo que puede ejecutarse en paralelo.
+    """
+    incident_code = incidencia['codIncidencia']
+    system_metrics.record_incident_start(incident_code)
     
-    # Procesar cada incidencia
-    resultados = []
-    tipos_resolucion = []
-    errores_api = {"gestor_incidencias": 0, "sistema": 0}
+    main_logger.info(f"Procesando incidencia {i}: {incident_code}")
     
-    for i, incidencia in enumerate(incidencias, 1):
-        incident_code = incidencia['codIncidencia']
-        system_metrics.record_incident_start(incident_code)
-        
-        main_logger.info(f"Procesando incidencia {i}/{total_incidencias}: {incident_code}")
-        
-        try:
-            # Procesar adjuntos y mejorar historial
-            enhanced_incidencia = process_incident_attachments(incidencia)
-            
-            # Generar versiones reformuladas
+    try:
+        def rephrase(enhanced_incidencia):
             main_logger.info("Generando consultas...")
             rephrase_response = rephrase_incidence(enhanced_incidencia)
             
@@ -139,28 +176,30 @@ def main():
             })
             
             rephrased_versions = convert_json_response(rephrase_response, "rephrase")
-            rephrased_versions = [str(incidencia["descripcion"])] + rephrased_versions
             
             # Debug significativo: versiones reformuladas generadas
             main_logger.debug(f"Versiones reformuladas generadas", extra_data={
                 "action": "rephrased_versions_created",
                 "codIncidencia": incident_code,
-                "versions_count": len(rephrased_versions),
-                "versions_preview": [v[:50] + "..." if len(v) > 50 else v for v in rephrased_versions[:3]]
+                "versions_count": len(rephrased_versions) + 1,
+                "versions_preview": [v[:50] + "..." if len(v) > 50 else v for v in ([str(incidencia["descripcion"])] + rephrased_versions)[:3]]
             })
-            
-            # Obtener soluciones relevantes
+            return rephrased_versions
+        
+        def relevance(original_results, rephrased_results):
+            # Misma fusión que antes: primero la descripción original y después las reformulaciones
             main_logger.info("Buscando soluciones relevantes...")
-            all_relevant_solutions = collect_relevant_solutions(rephrased_versions)
+            all_relevant_solutions = collect_relevant_solutions(original_results + rephrased_results)
             
             # Registrar métricas de soluciones encontradas
             system_metrics.record_solutions_found(len(all_relevant_solutions))
-            
-            # Generar resolución final con validación crítica
+            return all_relevant_solutions
+        
+        def critic(enhanced_incidencia, all_relevant_solutions):
             main_logger.info("Generando resolución final con validación crítica...")
-            resolution = process_resolution_with_critic(enhanced_incidencia, all_relevant_solutions)
-
-            # Extraer palabras clave
+            return process_resolution_with_critic(enhanced_incidencia, all_relevant_solutions)
+        
+        def keywords_stage(enhanced_incidencia):
             main_logger.info("Extrayendo palabras clave...")
             keywords_response = extract_keywords(enhanced_incidencia)
             keywords = convert_json_response(keywords_response, "keywords")
@@ -172,57 +211,172 @@ def main():
                 "keywords": keywords,
                 "keywords_count": len(keywords)
             })
-            
-            # Procesar la resolución
-            main_logger.info("Ejecutando resolución")
-            result = process_resolution(resolution, incidencia, keywords)
-            result["keywords"] = keywords
-            
-            # Almacenar resultado y tipo de resolución
-            resultados.append({"incidencia": incidencia, "resolucion": result})
+            return keywords
+        
+        # Las palabras clave solo necesitan la incidencia con adjuntos y la búsqueda por la
+        # descripción original no espera a la reformulación: se ejecutan en paralelo
+        results, timings = run_stage_graph({
+            "attachments": (lambda: process_incident_attachments(incidencia), ()),
+            "search_original": (lambda: search_versions([str(incidencia["descripcion"])]), ()),
+            "rephrase": (rephrase, ("attachments",)),
+            "search_rephrased": (search_versions, ("rephrase",)),
+            "relevance": (relevance, ("search_original", "search_rephrased")),
+            "critic": (critic, ("attachments", "relevance")),
+            "keywords": (keywords_stage, ("attachments",))
+        }, stage_executor)
+        resolution, keywords = results["critic"], results["keywords"]
+        
+        main_logger.debug("Etapas de la incidencia completadas", extra_data={
+            "action": "incident_stages_timing",
+            "codIncidencia": incident_code,
+            "stage_ms": {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+        })
+        
+        # Procesar la resolución
+        main_logger.info("Ejecutando resolución")
+        result = process_resolution(resolution, incidencia, keywords)
+        result["keywords"] = keywords
+        
+        resolucion_automatica = resolution.get("metadata",{}).get("RESOLUCION AUTOMÁTICA")
+        if resolucion_automatica == None:
+            resolucion_automatica = "manual"
+            system_metrics.record_processing_error("Error obteniendo resolución automática", incident_code)
+        
+        # Rastrear tipos de resolución originales para casos api|xxx
+        final_resolution_type = result.get("RESOLUCION AUTOMÁTICA", resolucion_automatica)
+        original_resolution_type = result.get("original_resolution_type", resolucion_automatica)
+        
+        # Formato para estadísticas: mostrar "api|xxx[final]" para casos api
+        if original_resolution_type != final_resolution_type and original_resolution_type.startswith("api|"):
+            display_resolution = f"{original_resolution_type}[{final_resolution_type}]"
+        else:
+            display_resolution = resolucion_automatica
+        
+        system_metrics.record_incident_end(incident_code, display_resolution)
+        main_logger.info(f"Resolución completada: {display_resolution}")
+        return {"incidencia": incidencia, "resolucion": result}, display_resolution, needs_retry(result.get("estado_api", {}))
+        
+    except CircuitOpenError as e:
+        # Dependencia caída: se deja para revisión manual sin esperar a sus timeouts
+        result = {
+            "RESOLUCION AUTOMÁTICA": "manual",
+            "BUZON REASIGNACION": "",
+            "SOLUCIÓN": f"Dependencia {e.dependency} no disponible (circuito abierto), revisar manualmente",
+            "estado_api": {"gestor_incidencias": "", "sistema": ""}
+        }
+        system_metrics.record_incident_end(incident_code, "manual")
+        main_logger.warning(f"Incidencia {incident_code} derivada a revisión manual por circuito abierto", extra_data={
+            "action": "circuit_open_manual_fallback",
+            "codIncidencia": incident_code,
+            "dependency": e.dependency
+        })
+        # No se ha enviado nada al gestor: se reintenta cuando la dependencia se recupere
+        return {"incidencia": incidencia, "resolucion": result}, "manual", True
+        
+    except Exception as e:
+        system_metrics.record_incident_failed(incident_code)
+        system_metrics.record_processing_error(str(e), incident_code)
+        main_logger.error(f"Error procesando incidencia {incident_code}", extra_data={
+            "action": "incident_processing_error",
+            "codIncidencia": incident_code,
+            "error": str(e)
+        })
+        return None
 
-            resolucion_automatica = resolution.get("metadata",{}).get("RESOLUCION AUTOMÁTICA")
-            if resolucion_automatica == None:
-                resolucion_automatica = "manual"
-                system_metrics.record_processing_error("Error obteniendo resolución automática", incident_code)
-            
-            # Rastrear tipos de resolución originales para casos api|xxx
-            final_resolution_type = result.get("RESOLUCION AUTOMÁTICA", resolucion_automatica)
-            original_resolution_type = result.get("original_resolution_type", resolucion_automatica)
-            
-            # Formato para estadísticas: mostrar "api|xxx[final]" para casos api
-            if original_resolution_type != final_resolution_type and original_resolution_type.startswith("api|"):
-                display_resolution = f"{original_resolution_type}[{final_resolution_type}]"
-            else:
-                display_resolution = resolucion_automatica
-            
-            tipos_resolucion.append(display_resolution)
-            system_metrics.record_incident_end(display_resolution)
-            
-            # Contar errores de API
-            estado_api = result.get("estado_api", {})
-            if estado_api.get("gestor_incidencias", "").startswith("error"):
-                errores_api["gestor_incidencias"] += 1
-                system_metrics.record_api_error("gestor_incidencias")
-            if estado_api.get("sistema", "").startswith("error"):
-                errores_api["sistema"] += 1
-                system_metrics.record_api_error("sistema")
-            
-            main_logger.info(f"Resolución completada: {display_resolution}")
-            
+def process_incidents(incidencias: Iterable[Dict[str, Any]], stop: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    Procesa las incidencias con hasta INCIDENT_WORKERS en paralelo y agrega sus resultados.
+    
+    Si se activa stop, o falla la obtención de la siguiente página del listado, no se empiezan
+    incidencias nuevas; las que están en curso terminan y se devuelve lo procesado (el fallo del
+    listado queda en "error_listado"). En "procesadas" quedan los pares (incidencia, resultado)
+    de las que no hay que reintentar.
+    """
+    total_incidencias = 0
+    error_listado = None
+    
+    # Procesar hasta INCIDENT_WORKERS incidencias a la vez; el semáforo frena la paginación
+    # para no leer más incidencias de las que se pueden procesar
+    in_flight = threading.BoundedSemaphore(INCIDENT_WORKERS)
+    futures = []
+    with ThreadPoolExecutor(max_workers=INCIDENT_WORKERS) as executor:
+        try:
+            for i, incidencia in enumerate(incidencias, 1):
+                if stop is not None and stop.is_set():
+                    break
+                total_incidencias = i
+                in_flight.acquire()
+                future = executor.submit(process_incident, i, incidencia)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append((incidencia, future))
         except Exception as e:
-            system_metrics.record_processing_error(str(e), incident_code)
-            main_logger.error(f"Error procesando incidencia {incident_code}", extra_data={
-                "action": "incident_processing_error",
-                "codIncidencia": incident_code,
-                "error": str(e)
+            # Las incidencias ya enviadas pueden estar resueltas en el gestor: se agregan igualmente
+            error_listado = str(e)
+            system_metrics.record_api_error("gestor_incidencias")
+            main_logger.error("Error obteniendo incidencias abiertas, no se empiezan más", extra_data={
+                "action": "incident_listing_error",
+                "incidents_started": total_incidencias,
+                "error": error_listado
             })
     
+    # Agregar en el orden de llegada para que el reporte sea determinista
+    resultados = []
+    tipos_resolucion = []
+    errores_api = {"gestor_incidencias": 0, "sistema": 0}
+    procesadas = []
+    for incidencia, future in futures:
+        outcome = future.result()
+        if outcome is None:
+            continue
+        resultado, display_resolution, reintentar = outcome
+        resultados.append(resultado)
+        tipos_resolucion.append(display_resolution)
+        if not reintentar:
+            procesadas.append((incidencia, resultado))
+        
+        # Contar errores de API
+        estado_api = resultado["resolucion"].get("estado_api", {})
+        if estado_api.get("gestor_incidencias", "").startswith("error"):
+            errores_api["gestor_incidencias"] += 1
+            system_metrics.record_api_error("gestor_incidencias")
+        if estado_api.get("sistema", "").startswith("error"):
+            errores_api["sistema"] += 1
+            system_metrics.record_api_error("sistema")
+    
+    main_logger.info(f"Total de incidencias procesadas: {total_incidencias}")
+    return {
+        "total_incidencias": total_incidencias,
+        "resultados": resultados,
+        "tipos_resolucion": tipos_resolucion,
+        "errores_api": errores_api,
+        "procesadas": procesadas,
+        "error_listado": error_listado
+    }
+
+def write_report(ejecucion: Dict[str, Any], start_time: float) -> str:
+    """Vuelca el estado de la cola write-behind en los resultados, guarda el reporte y registra las estadísticas."""
+    resultados = ejecucion["resultados"]
+    errores_api = ejecucion["errores_api"]
+    
+    # Esperar a que la cola write-behind confirme las acciones y volcar su estado en el reporte
+    if USE_WRITE_BEHIND:
+        if not write_behind_queue.flush(timeout=WRITE_BEHIND_FLUSH_TIMEOUT):
+            main_logger.warning("Quedan acciones sin confirmar en la cola write-behind, se reenviarán en la siguiente ejecución")
+        for resultado in resultados:
+            estado_api = resultado["resolucion"].get("estado_api", {})
+            op_id = estado_api.get("operacion_gestor")
+            if not op_id:
+                continue
+            estado_api["gestor_incidencias"] = write_behind_queue.pop_result(op_id) or "pendiente"
+            if estado_api["gestor_incidencias"].startswith("error"):
+                errores_api["gestor_incidencias"] += 1
+                system_metrics.record_api_error("gestor_incidencias")
+    
     # Calcular estadísticas
-    stats = Counter(tipos_resolucion)
+    stats = Counter(ejecucion["tipos_resolucion"])
     
-    # Guardar reporte
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
+    # Guardar reporte (con segundos: en modo daemon puede haber varios ciclos por minuto)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     report_path = f"resources/reporte{timestamp}.json"
     
     with open(report_path, "w", encoding="utf-8") as f:
@@ -232,17 +386,159 @@ def main():
     total_time = time.time() - start_time
     main_logger.info("=== Estadísticas Finales ===", extra_data={
         "action": "final_statistics",
-        "total_incidencias": total_incidencias,
+        "total_incidencias": ejecucion["total_incidencias"],
         "tiempo_total": round(total_time, 2),
         "distribucion_resoluciones": dict(stats),
         "errores_gestor": errores_api['gestor_incidencias'],
         "errores_sistema": errores_api['sistema'],
+        "error_listado": ejecucion["error_listado"],
         "reporte_path": report_path
     })
+    return report_path
+
+def incident_fingerprint(incidencia: Dict[str, Any]) -> str:
+    """
+    Huella del contenido de una incidencia aportado por personas. Excluye el estado y las entradas
+    del historial de GESTOR_SYSTEM_AUTHOR, que son las que añaden nuestras propias acciones: si no,
+    cada acción del daemon haría que la incidencia pareciera modificada en el siguiente ciclo.
+    """
+    contenido = {k: v for k, v in incidencia.items() if k not in ("estado", "historial")}
+    contenido["historial"] = [
+        entry for entry in incidencia.get("historial") or []
+        if entry.get("Autor") != GESTOR_SYSTEM_AUTHOR
+    ]
+    return hashlib.sha256(json.dumps(contenido, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def load_daemon_state() -> Dict[str, str]:
+    """Huellas de las incidencias procesadas por ejecuciones anteriores del daemon ({} si no hay)."""
+    try:
+        with open(DAEMON_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)["procesadas"]
+    except FileNotFoundError:
+        return {}
+
+def save_daemon_state(procesadas: Dict[str, str]):
+    """Guarda las huellas de forma atómica para que un reinicio no vuelva a procesar lo ya hecho."""
+    tmp_path = f"{DAEMON_STATE_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"procesadas": procesadas, "actualizado": datetime.now().isoformat()}, f, ensure_ascii=False)
+    os.replace(tmp_path, DAEMON_STATE_FILE)
+
+def run_daemon(poll_seconds: float = DAEMON_POLL_SECONDS):
+    """
+    Modo daemon: consulta las incidencias abiertas cada poll_seconds y procesa solo las nuevas o modificadas.
+    
+    Modelos, clientes y cachés se mantienen cargados entre ciclos. SIGINT/SIGTERM terminan el ciclo en
+    curso sin empezar incidencias nuevas, guardan su reporte, vacían la cola write-behind y registran
+    las métricas acumuladas.
+    """
+    stop = threading.Event()
+    
+    def request_stop(signum, frame):
+        main_logger.info("Parada solicitada, terminando las incidencias en curso...", extra_data={
+            "action": "daemon_stop_requested",
+            "signal": signum
+        })
+        stop.set()
+    
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    
+    # Huella de cada incidencia abierta ya procesada; si no cambia no se vuelve a procesar
+    procesadas = load_daemon_state()
+    main_logger.info(f"Modo daemon iniciado, consultando incidencias cada {poll_seconds}s", extra_data={
+        "action": "daemon_started",
+        "poll_seconds": poll_seconds,
+        "known_incidents": len(procesadas),
+        "workers": INCIDENT_WORKERS
+    })
+    
+    while not stop.is_set():
+        start_time = time.time()
+        if USE_WRITE_BEHIND:
+            write_behind_queue.requeue_pending()
+        
+        abiertas = set()
+        listado_completo = False
+        
+        def pendientes():
+            nonlocal listado_completo
+            for incidencia in iter_incidencias():
+                code = incidencia["codIncidencia"]
+                abiertas.add(code)
+                if procesadas.get(code) != incident_fingerprint(incidencia):
+                    yield incidencia
+            listado_completo = True
+        
+        # Un fallo del listado no se propaga: lo ya procesado se anota y el resto se reintenta
+        # en el siguiente ciclo
+        ejecucion = process_incidents(pendientes(), stop)
+        
+        # El reporte vuelca el resultado final de las acciones de la cola write-behind
+        if ejecucion["total_incidencias"]:
+            write_report(ejecucion, start_time)
+        else:
+            main_logger.debug("Sin incidencias nuevas o modificadas", extra_data={
+                "action": "daemon_idle_cycle",
+                "open_incidents": len(abiertas)
+            })
+        
+        # Las que fallan (incluidas las derivadas a manual por circuito abierto y las acciones que
+        # el gestor rechazó o no llegaron a enviarse) no se anotan, para reintentarlas en el siguiente ciclo
+        reintentos = 0
+        for incidencia, resultado in ejecucion["procesadas"]:
+            estado_api = resultado["resolucion"].get("estado_api", {})
+            if needs_retry(estado_api):
+                # La acción no enviada se retira: al reprocesar la incidencia se encola de nuevo
+                if estado_api.get("operacion_gestor"):
+                    write_behind_queue.discard(estado_api["operacion_gestor"])
+                reintentos += 1
+                continue
+            procesadas[incidencia["codIncidencia"]] = incident_fingerprint(incidencia)
+        if reintentos:
+            main_logger.info(f"{reintentos} incidencias con acciones fallidas se reintentarán en el siguiente ciclo", extra_data={
+                "action": "daemon_retry_scheduled",
+                "incidents": reintentos
+            })
+        
+        # Olvidar las que ya no están abiertas (solo si se recorrió el listado entero)
+        if listado_completo:
+            procesadas = {code: huella for code, huella in procesadas.items() if code in abiertas}
+        save_daemon_state(procesadas)
+        
+        stop.wait(poll_seconds)
+    
+    # Parada ordenada: confirmar las acciones pendientes y registrar las métricas acumuladas
+    if USE_WRITE_BEHIND and not write_behind_queue.flush(timeout=WRITE_BEHIND_FLUSH_TIMEOUT):
+        main_logger.warning("Quedan acciones sin confirmar en la cola write-behind, se reenviarán en la siguiente ejecución")
+    system_metrics.log_final_metrics()
+    main_logger.info("Modo daemon detenido", extra_data={"action": "daemon_stopped"})
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resolución automática de incidencias abiertas")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Se queda en ejecución y procesa las incidencias nuevas o modificadas periódicamente")
+    parser.add_argument("--poll-seconds", type=float, default=DAEMON_POLL_SECONDS,
+                        help="Segundos entre consultas al gestor en modo daemon")
+    return parser.parse_args()
+
+def main():
+    """Función principal del sistema."""
+    args = parse_args()
+    if args.daemon:
+        run_daemon(args.poll_seconds)
+        return
+    
+    start_time = time.time()
+    
+    # Obtener incidencias abiertas página a página: se procesan mientras llegan las siguientes
+    main_logger.info("Obteniendo incidencias abiertas...")
+    ejecucion = process_incidents(iter_incidencias())
+    write_report(ejecucion, start_time)
     
     # Métricas avanzadas del sistema
     system_metrics.log_final_metrics()
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,5 +1,5 @@
 import { Router, Request, Response } from 'express';
-import { Incidencia, PatchIncidenciaRequest, HistorialEntry } from './types';
+import { Incidencia, PatchIncidenciaRequest, HistorialEntry, OperacionLote, ResultadoOperacion } from './types';
 
 const router = Router();
 
@@ -573,34 +573,91 @@ const incidencias: Incidencia[] = [
   }
 ];
 
-// GET /api/incidencias?buzon=GR_SAL_COMP_AUTORIZACIONES
+// Paginación por cursor: si se indica `limit`, devuelve como mucho `limit` incidencias posteriores
+// al código `cursor` (en el orden de la lista completa, estable aunque cambie el buzón de alguna)
+// y el cursor de la página siguiente en la cabecera X-Next-Cursor (ausente en la última página)
+const paginar = (req: Request, res: Response, lista: Incidencia[], filtro: (inc: Incidencia) => boolean) => {
+  const limit = parseInt(req.query.limit as string, 10);
+  if (!limit) {
+    return res.json(lista.filter(filtro));
+  }
+  if (limit < 0) {
+    return res.status(400).json({ error: 'Parámetro limit inválido' });
+  }
+
+  const cursor = req.query.cursor as string;
+  let inicio = 0;
+  if (cursor) {
+    const posicion = lista.findIndex(inc => inc.codIncidencia === cursor);
+    if (posicion === -1) {
+      return res.status(400).json({ error: 'Parámetro cursor inválido' });
+    }
+    inicio = posicion + 1;
+  }
+
+  const pagina: Incidencia[] = [];
+  let i = inicio;
+  for (; i < lista.length && pagina.length < limit; i++) {
+    if (filtro(lista[i])) {
+      pagina.push(lista[i]);
+    }
+  }
+  if (pagina.length === limit && lista.slice(i).some(filtro)) {
+    res.setHeader('X-Next-Cursor', pagina[pagina.length - 1].codIncidencia);
+  }
+  res.json(pagina);
+};
+
+// GET /api/incidencias?buzon=GR_SAL_COMP_AUTORIZACIONES&limit=50&cursor=MOCK_INC0050
 router.get('/incidencias', (req: Request, res: Response) => {
   const buzon = req.query.buzon as string;
-  const incidenciasFiltradas = buzon 
-    ? incidencias.filter(inc => inc.buzon === buzon)
-    : incidencias;
-  res.json(incidenciasFiltradas);
+  paginar(req, res, incidencias, inc => !buzon || inc.buzon === buzon);
 });
 
-// GET /api/incidencias/cerradas
+// Convierte una fecha "dd/mm/yyyy HH:MM:SS CEST" del historial a Date
+const parseFecha = (fecha: string): Date | null => {
+  const match = /^(\d{2})\/(\d{2})\/(\d{4})[ ,]+(\d{1,2}):(\d{2}):(\d{2})/.exec(fecha || '');
+  if (!match) {
+    return null;
+  }
+  const [, dia, mes, anio, hora, minuto, segundo] = match.map(Number);
+  return new Date(anio, mes - 1, dia, hora, minuto, segundo);
+};
+
+// Fecha de cierre: última entrada del historial (o apertura si no hay historial)
+const fechaCierre = (incidencia: Incidencia): Date | null => {
+  const ultima = incidencia.historial[incidencia.historial.length - 1];
+  return parseFecha(ultima ? ultima.Fecha : incidencia.apertura);
+};
+
+// GET /api/incidencias/cerradas?buzon=GR_SAL_COMP_AUTORIZACIONES&since=2024-11-20T12:00:00&limit=50&cursor=...
 router.get('/incidencias/cerradas', (req: Request, res: Response) => {
-  res.json(incidenciasCerradas);
-});
+  const buzon = req.query.buzon as string;
+  const since = req.query.since as string;
 
-// PATCH /api/incidencias/:codIncidencia
-router.patch('/incidencias/:codIncidencia', (req: Request, res: Response) => {
-  const { codIncidencia } = req.params;
-  const patchData = req.body; // Aceptar cualquier estructura
-  
-  // Log para debugging
-  console.log('Recibida petición PATCH incidencia:', codIncidencia, JSON.stringify(patchData, null, 2));
-  
-  // Buscar incidencia
-  const incidencia = incidencias.find(inc => inc.codIncidencia === codIncidencia);
-  if (!incidencia) {
-    return res.status(404).json({ error: 'Incidencia no encontrada' });
+  let desde: Date | null = null;
+  if (since) {
+    desde = new Date(since);
+    if (isNaN(desde.getTime())) {
+      return res.status(400).json({ error: 'Parámetro since inválido' });
+    }
   }
 
+  // Cierres en o después de la marca (el cliente descarta los ya evaluados)
+  paginar(req, res, incidenciasCerradas, inc => {
+    if (buzon && inc.buzon !== buzon) {
+      return false;
+    }
+    if (!desde) {
+      return true;
+    }
+    const cierre = fechaCierre(inc);
+    return cierre !== null && cierre.getTime() >= desde.getTime();
+  });
+});
+
+// Aplica una acción sobre una incidencia abierta (historial + estado)
+const aplicarAccion = (incidencia: Incidencia, patchData: any) => {
   const now = new Date().toLocaleString('es-ES', { timeZone: 'Europe/Madrid' });
   
   // Extraer campos de manera flexible - aceptar cualquier variante
@@ -630,6 +687,57 @@ router.patch('/incidencias/:codIncidencia', (req: Request, res: Response) => {
   } else {
     incidencia.estado = "En espera";
   }
+};
+
+// Resultados de las operaciones en lote ya aplicadas (los reintentos no se aplican dos veces)
+const operacionesAplicadas = new Map<string, ResultadoOperacion>();
+
+// POST /api/incidencias/bulk  { operaciones: [{ idOperacion, codIncidencia, action, ... }] }
+router.post('/incidencias/bulk', (req: Request, res: Response) => {
+  const operaciones: OperacionLote[] = req.body && req.body.operaciones;
+  if (!Array.isArray(operaciones)) {
+    return res.status(400).json({ error: 'Se esperaba una lista de operaciones' });
+  }
+
+  console.log('Recibida petición bulk:', operaciones.length, 'operaciones');
+
+  const resultados = operaciones.map((operacion): ResultadoOperacion => {
+    const previo = operacion.idOperacion ? operacionesAplicadas.get(operacion.idOperacion) : undefined;
+    if (previo) {
+      return previo;
+    }
+
+    const incidencia = incidencias.find(inc => inc.codIncidencia === operacion.codIncidencia);
+    const resultado: ResultadoOperacion = incidencia
+      ? { idOperacion: operacion.idOperacion, codIncidencia: operacion.codIncidencia, ok: true, incidencia }
+      : { idOperacion: operacion.idOperacion, codIncidencia: operacion.codIncidencia, ok: false, error: 'Incidencia no encontrada' };
+    if (incidencia) {
+      aplicarAccion(incidencia, operacion);
+    }
+    if (operacion.idOperacion) {
+      operacionesAplicadas.set(operacion.idOperacion, resultado);
+    }
+    return resultado;
+  });
+
+  res.json({ resultados });
+});
+
+// PATCH /api/incidencias/:codIncidencia
+router.patch('/incidencias/:codIncidencia', (req: Request, res: Response) => {
+  const { codIncidencia } = req.params;
+  const patchData = req.body; // Aceptar cualquier estructura
+  
+  // Log para debugging
+  console.log('Recibida petición PATCH incidencia:', codIncidencia, JSON.stringify(patchData, null, 2));
+  
+  // Buscar incidencia
+  const incidencia = incidencias.find(inc => inc.codIncidencia === codIncidencia);
+  if (!incidencia) {
+    return res.status(404).json({ error: 'Incidencia no encontrada' });
+  }
+
+  aplicarAccion(incidencia, patchData);
 
   res.json(incidencia);
 });
@@ -27,4 +27,17 @@ export interface PatchIncidenciaRequest {
   buzonDestino?: string;
   notasResolucion?: string;
   detalle?: string;
-} 
\ No newline at end of file
+} 
+
+export interface OperacionLote extends PatchIncidenciaRequest {
+  idOperacion: string;
+  codIncidencia: string;
+}
+
+export interface ResultadoOperacion {
+  idOperacion: string;
+  codIncidencia: string;
+  ok: boolean;
+  error?: string;
+  incidencia?: Incidencia;
+}